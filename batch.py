@@ -1,26 +1,69 @@
 """
 
-Example batch script. This one want as input a directory that has txt and fact files.
+Example batch script. This one wants as input a directory that has txt and fact files.
+
+Usage:
+
+   % python batch.py [-j N] INDIR [OUTDIR]
+
+   The sect files are written to OUTDIR, which is data/tmp by default. One parser is
+   used for all files, or one for each worker process with -j. Completed documents are
+   recorded in OUTDIR/batch.manifest, and when the script is run again after it was
+   interrupted, documents that were completed and whose input did not change are
+   skipped. See utils/manifest.py.
 
 """
 
-import os, sys, glob
+import os, sys, glob, getopt
 
 from main import Parser
+from utils.manifest import Manifest
+
 
+def usage():
+    print "\nUsage:"
+    print '  % python batch.py [-j N] INDIR [OUTDIR]'
 
-INDIR = sys.argv[1]
-OUTDIR = 'data/tmp'
 
+try:
+    (opts, args) = getopt.getopt(sys.argv[1:], 'j:')
+except getopt.GetoptError, err:
+    print str(err)
+    usage()
+    sys.exit(2)
+if len(args) not in (1, 2):
+    usage()
+    sys.exit(2)
 
-for text_file in glob.glob("%s/*.txt" % INDIR):
+jobs = 1
+for opt, val in opts:
+    if opt == '-j':
+        if not val.isdigit() or int(val) < 1:
+            print "The number of jobs should be a positive integer:", val
+            usage()
+            sys.exit(2)
+        jobs = int(val)
+
+INDIR = args[0]
+OUTDIR = args[1] if len(args) > 1 else 'data/tmp'
+if not os.path.isdir(OUTDIR):
+    os.makedirs(OUTDIR)
+
+
+documents = []
+for text_file in sorted(glob.glob("%s/*.txt" % INDIR)):
     basename = os.path.basename(text_file)
     fact_file = text_file[:-3] + 'fact'
     sect_file = os.path.join(OUTDIR, basename[:-3] + 'sect')
     if os.path.exists(fact_file):
         #if not basename == 'USPP021257P2.txt':
         #    continue
-        print basename
-        parser = Parser()
-        parser.collection = 'LEXISNEXIS'
-        parser.process_file(text_file, fact_file, sect_file, verbose=False)
+        documents.append((len(documents) + 1, (text_file, fact_file, sect_file)))
+
+parser = Parser()
+parser.collection = 'LEXISNEXIS'
+parser.jobs = jobs
+parser.manifest = Manifest(os.path.join(OUTDIR, 'batch.manifest'))
+parser.process_documents(documents, len(documents))
+parser.manifest.close()
+print parser.manifest.report()
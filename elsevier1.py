@@ -38,7 +38,8 @@ structure parser so instead we have used the number of structure facts with the
 #   only allow References and Acknowledgements as section headers without a number.
 
 
-import codecs, re
+import re
+from array import array
 
 import normheader
 from sections import Section, SectionFactory, link_sections
@@ -47,11 +48,13 @@ from utils.misc import connect
 
 class SimpleElsevierSectionFactory(SectionFactory):
 
-    def __init__(self, text_file, fact_file, sect_file, fact_type, language, verbose=False):
+    def __init__(self, text_file, fact_file, sect_file, fact_type, language, verbose=False,
+                 data=None, facts=None):
         """
         Initialize the factory by reading segment boundaries from the fact file and the
         actual segments from the text file. """
-        SectionFactory.__init__(self, text_file, fact_file, sect_file, fact_type, language)
+        SectionFactory.__init__(self, text_file, fact_file, sect_file, fact_type, language,
+                                data=data, facts=facts)
         self.segment_boundaries = self._read_fact_file()
         self.segments = self._read_segments()
         self.sections = []
@@ -64,7 +67,7 @@ class SimpleElsevierSectionFactory(SectionFactory):
         genrates one text structure element, but at times it will find a couple more."""
         re_STRUCTURE = re.compile("STRUCTURE TYPE=\"(\S+)\" START=(\d+) END=(\d+)")
         boundaries = []
-        for line in open(self.fact_file):
+        for line in self.fact_lines():
             result = re_STRUCTURE.match(line)
             if result is not None:
                 structure_type, start, end = result.groups()
@@ -76,10 +79,9 @@ class SimpleElsevierSectionFactory(SectionFactory):
         """
         Create an ElsevierSegment for each pair of segment boundaries and return a list of
         those segments."""
-        self.text = codecs.open(self.text_file, encoding='utf-8').read()
+        self.text = self.read_text()
         segments = []
         for start, end in self.segment_boundaries:
-            segment = ElsevierSegment(self, start, end)
             segments.append(ElsevierSegment(self, start, end))
         return segments
         
@@ -138,25 +140,30 @@ class ElsevierSegment(object):
         #print_list(self.elements)
 
     def _read_lines(self):
-        line, i, max = '', 0, len(self)
-        begin, end = i, i
+        """
+        Split the text on newlines and create an ElsevierLine for each line, a line is
+        only created when its newline is found, so text after the last newline is not
+        included. Offsets are relative to the segment. The first line starts at 0, other
+        lines start at the offset of the newline before them and their end is the begin
+        offset plus the length of the line."""
+        strings = self.text.split("\n")[:-1]
         self.lines = []
-        while i < max:
-            char = self.text[i]
-            if self.text[i] == "\n":
-                l = ElsevierLine(line, begin, end)
-                self.lines.append(l)
-                line, begin, end = '', i, i
-            else:
-                line += char
-                end += 1
-            i += 1
+        begin = 0
+        for i, string in enumerate(strings):
+            self.lines.append(ElsevierLine(string, begin, begin + len(string)))
+            begin += len(string) if i == 0 else len(string) + 1
         connect(self.lines)
-            
+
     def _characterize_lines(self):
-        """Ask all lines to analyze themselves."""
-        for line in self.lines:
-            line.characterize()
+        """Collect the characteristics of all lines, which are kept in self.features."""
+        self.features = LineFeatures(self.text, self.lines)
+        for i, line in enumerate(self.lines):
+            line.features = self.features
+            line.index = i
+            prefix = self.features.prefixes[i]
+            if prefix:
+                line.header_number = prefix
+                line.header_level = len([n for n in prefix.split('.') if n])
 
     def _set_features(self):
         """Set some segment level features. This is where a lot of magic variables live."""
@@ -184,8 +191,8 @@ class ElsevierSegment(object):
         the content of self.section is not yet what is expected by the factory."""
         def replace_line(line):
             return ElsevierHeader(line) if line.header else ElsevierSection(line)
-        for line in self.lines:
-            if line.is_header(self.f_spaceous):
+        for (line, is_header) in zip(self.lines, self.features.headers(self.f_spaceous)):
+            if is_header:
                 line.mark_as_header()
         self.elements = [replace_line(l) for l in self.lines]
         connect(self.elements)
@@ -224,7 +231,7 @@ class ElsevierSegment(object):
         Section, and put them on the self.sections list."""
         for e in self.elements:
             #if e.is_section():
-            section = e.generalize()
+            section = e.generalize(self.factory.new_section)
             self.sections.append(section)
 
     def print_features(self):
@@ -235,16 +242,90 @@ class ElsevierSegment(object):
 
 
         
+class LineFeatures(object):
+    """
+    The characteristics of all lines in a segment, like whether a line is long or short,
+    has a number and whether it is an orphan. Each characteristic is an array with a
+    value for each line, and all arrays are filled in one go. The numbering prefixes are
+    found with one regular expression search over the segment text. The header decision
+    is also made for all lines at once, by headers()."""
+
+    re_prefix = re.compile('^\d\.(\d\.)?', re.MULTILINE)
+
+    def __init__(self, text, lines):
+        count = len(lines)
+        lengths = [line.length for line in lines]
+        empty = [line.line.strip() == '' for line in lines]
+        line_starts = dict([(0 if i == 0 else line.begin + 1, i)
+                            for (i, line) in enumerate(lines)])
+        self.prefixes = [''] * count
+        for match in self.re_prefix.finditer(text):
+            i = line_starts.get(match.start())
+            if i is not None:
+                self.prefixes[i] = match.group(0)
+        # the line above the first line and the line below the last line count as empty
+        above = [True] + empty[:-1] if count else []
+        below = empty[1:] + [True] if count else []
+        self.is_numbered = array('B', [prefix != '' for prefix in self.prefixes])
+        self.is_short = array('B', [length < 50 for length in lengths])
+        self.is_long = array('B', [length > 100 for length in lengths])
+        self.is_empty = array('B', empty)
+        self.has_empty_line_above = array('B', above)
+        self.has_empty_line_below = array('B', below)
+        self.is_orphan = array('B', [a and b for (a, b) in zip(above, below)])
+
+    def headers(self, spaceous):
+        """
+        Return a list with for each line True if the line is a header and False otherwise.
+        The answer depends on local characteristics of the line, but takes as a parameter
+        the spaceousness of the file, which is derived from the whiteline ratio of the
+        file, which is a normalized measure of how many white lines the file has. This
+        measure is motivated by the fact that there seem to be two kinds of simple
+        Elsevier files, one with many white lines, where the headers are always orphans,
+        and one with less white lines, where the headers are not followed by an empty
+        line.
+
+        The following cases form a kind of decision tree, the clearest cases are first,
+        but it gets more murky going down the line. Cases are not mutually exclusive.
+
+           numbered and short and orphan                    ==>  True
+           numbered and short and empty_above and not spaceous  ==>  True
+           empty                                            ==>  False
+           short and empty_above and not spaceous           ==>  True
+           otherwise                                        ==>  False """
+        dense = not spaceous
+        return [bool(short and ((numbered and orphan) or
+                                (above and dense and (numbered or not empty))))
+                for (numbered, short, empty, orphan, above)
+                in zip(self.is_numbered, self.is_short, self.is_empty, self.is_orphan,
+                       self.has_empty_line_above)]
+
+    def characteristics(self, i):
+        character = []
+        if self.is_numbered[i]: character.append('number')
+        if self.is_short[i]: character.append('short')
+        if self.is_long[i]: character.append('long')
+        if self.is_empty[i]: character.append('empty')
+        if self.is_orphan[i]:
+            character.append('orphan')
+        else:
+            if self.has_empty_line_above[i]: character.append('empty_above')
+            if self.has_empty_line_below[i]: character.append('empty_below')
+        return ' '.join(character)
+
+
 class ElsevierLine(object):
     """
     Object to represent a line in the text. It holds the following information: (1) the
     text string, (2) the begin and end offsets, (3) the length, (4) pointers to previous
     and next lines, and (5) a boolean that indicates that the line is a header, set to
     false by default. A line is a string of characters bordered by newlines, so the
-    newline is not part of the line itself. """
+    newline is not part of the line itself. The characteristics of the line are kept in
+    the LineFeatures of the segment, at the index of the line."""
+
+    __slots__ = ('line', 'begin', 'end', 'length', 'previous', 'next', 'header',
+                 'header_type', 'header_number', 'header_level', 'features', 'index')
 
-    re_prefix = re.compile('\d\.(\d\.)?')
-    
     def __init__(self, line, p1, p2):
         self.line = line
         self.begin = p1
@@ -256,7 +337,9 @@ class ElsevierLine(object):
         self.header_type = None
         self.header_number = None
         self.header_level = None
-        
+        self.features = None
+        self.index = None
+
     def __str__(self):
         l = self.line
         chars = 40 # number of characters to print from the line
@@ -266,98 +349,17 @@ class ElsevierLine(object):
         line = self.line if len(l) < chars else "%s ... %s" % (l[:chars/2], l[-chars/2:])        
         return "%s %-40s '%s'" % (header, character, line)
 
-    def characterize(self):
-        """
-        Collect some general characteristics about the line, like wheter it is long or
-        short, has a number and whether it is an orphan. Store this in instance variables
-        starting with 'is_' or 'has_'."""
-        self.is_numbered = False           # has number prefix
-        self.is_short = False              # is shorter than 50 characters
-        self.is_long = False               # is longer than 100 characters
-        self.is_orphan = False             # surrounded by empty lines
-        self.is_empty = False              # is an empty line
-        self.has_empty_line_above = False  # line above is empty or None
-        self.has_empty_line_below = False  # line below is empty or None
-        self._do_i_start_with_a_number()
-        self._am_i_surrounced_by_whitelines()
-        self._am_i_long_or_short()
-
-    def _do_i_start_with_a_number(self):
-        prefix = self.numbering_prefix()
-        if prefix:
-            self.is_numbered = True
-            self.header_number = prefix
-            self.header_level = len([n for n in prefix.split('.') if n])
-
-    def _am_i_surrounced_by_whitelines(self):
-        if self.previous is None or self.previous.line.strip() == '':
-            self.has_empty_line_above = True 
-        if self.next is None or self.next.line.strip() == '':
-            self.has_empty_line_below = True 
-        if self.has_empty_line_above and self.has_empty_line_below:
-            self.is_orphan = True
-
-    def _am_i_long_or_short(self):
-        if self.line.strip() == '':
-            self.is_empty = True
-        if self.length < 50:
-            self.is_short = True
-        if self.length > 100:
-            self.is_long = True
-
     def characteristics(self):
-        character = []
-        if self.is_numbered: character.append('number')
-        if self.is_short: character.append('short')
-        if self.is_long: character.append('long')
-        if self.is_empty: character.append('empty')
-        if self.is_orphan:
-            character.append('orphan')
-        else:
-            if self.has_empty_line_above: character.append('empty_above')
-            if self.has_empty_line_below: character.append('empty_below')
-        return ' '.join(character)#"%s%s%s" % (number, short, tall)
-
+        if self.features is None:
+            return ''
+        return self.features.characteristics(self.index)
 
     def is_header(self, spaceous):
         """
-        Return True if the line is a header, return False otherwise. The answer depends on
-        local characteristics of the line, but takes as a parameter the spaceousness of
-        the file, which is derived from the whiteline ratio of the file, which is a
-        normalized measure of how many white lines the file has. This measure is motivated
-        by the fact that there seem to be two kinds of simple Elsevier files, one with
-        many white lines, where the headers are always orphans, and one with less white
-        lines, where the headers are not followed by an empty line."""
-
-        # abbreviations
-        numbered = self.is_numbered
-        short = self.is_short
-        long = self.is_long
-        empty = self.is_empty
-        orphan = self.is_orphan
-        empty_line_above = self.has_empty_line_above
-        empty_line_below = self.has_empty_line_below
-
-        # The following cases form a kind of decision tree, the clearest cases are first,
-        # but it gets more murky going down the line. Cases are not mutually exclusive
-        if numbered and short and orphan:
-            return True
-        if numbered and short and empty_line_above and not spaceous:
-            return True
-        if empty:
-            return False
-        if short and empty_line_above and not spaceous:
-            return True
-
-        # default is for a line to not be a header
-        return False
-
-
-    def numbering_prefix(self):
-        match = self.re_prefix.match(self.line)
-        if match is not None:
-            return match.group(0)
-        return ''
+        Return True if the line is a header, return False otherwise. See
+        LineFeatures.headers() for the decision, which is made for all lines of the
+        segment at once, so use that one instead of calling this for each line."""
+        return self.features.headers(spaceous)[self.index]
 
     def mark_as_header(self):
         """
@@ -398,9 +400,10 @@ class ElsevierHeader(ElsevierSegmentElement):
     def is_header(self):
         return True
 
-    def generalize(self):
-        """Create a Section instance using local information and return it."""
-        section = Section()
+    def generalize(self, new_section=Section):
+        """Create a Section instance using local information and return it, new_section
+        is used to create the instance."""
+        section = new_section()
         section.start_index = self.begin
         # TODO: not sure why I have to add 1 to get it right, disconcerting!
         section.end_index = self.end + 1
@@ -437,9 +440,10 @@ class ElsevierSection(ElsevierSegmentElement):
         self.end = section.end
         self.lines.extend(section.lines)
 
-    def generalize(self):
-        """Create a Section instance using local information and return it."""
-        section = Section()
+    def generalize(self, new_section=Section):
+        """Create a Section instance using local information and return it, new_section
+        is used to create the instance."""
+        section = new_section()
         section.start_index = self.begin
         section.end_index = self.end
         section.text = "\n".join([l.line for l in self.lines])
@@ -6,8 +6,9 @@ Usage:
 
    % python main.py [OPTIONS] TEXT_FILE FACT_FILE STRUCTURE_FILE
    % python main.py [OPTIONS] XML_FILE TEXT_FILE TAGS_FILE FACT_FILE STRUCTURE_FILE
-   % python main.py [-c COLLECTION] [-l LANGUAGE] FILE_LIST
-   % python main.py [-c COLLECTION] [-l LANGUAGE] DIRECTORY
+   % python main.py [-c COLLECTION] [-l LANGUAGE] [-j N] FILE_LIST
+   % python main.py [-c COLLECTION] [-l LANGUAGE] [-j N] [--manifest FILE] DIRECTORY
+   % python main.py [-c COLLECTION] [-l LANGUAGE] ARCHIVE OUTPUT
    % python main.py -t
 
 In the first form, input is taken from TEXT_FILE, which contains the bare text, and
@@ -21,7 +22,37 @@ In the second form, the input is an xml file and three intermediate files are cr
 text file, tags file and facts file. As with form 1, the text file and the fact file are
 then used to create the sect file. Both forms have the same options, all optional:
 
-   [-h] [--debug] [-c COLLECTION] [-l LANGUAGE]
+   [-h] [--debug] [--standoff MODE] [--headers FILE] [--cache DIR [--cache-size MB]]
+   [-c COLLECTION] [-l LANGUAGE]
+
+The --standoff option is only relevant for the second form and determines how the text
+and the tags are extracted from the xml file. With XSLT (the default) the xsltproc and
+xmllint commands are run on the scripts in utils/standoff. With NATIVE the xml file is
+parsed once in-process by utils.xml.standoff(), which gives the same text and the same
+offsets. In that mode the text and the tags are handed to the section factory in memory,
+the text file and fact file are only written with --debug or -h, and the tags file is
+never created. This mode works for the LEXISNEXIS and CNKI collections.
+
+The --headers option can be used with all forms. FILE is a table with normalized headers
+and their semantic types, as created by normheader.py. Headers found in the table do not
+have to be typed again, and headers that are not found are added to the table at the end
+of the run. So running over a corpus once fills the table for later runs. The table is
+emptied when the mappings in normheader.sem_types change. A line with the number of
+headers in the table and the hit rate is printed at the end.
+
+The --cache option can also be used with all forms. DIR is a result cache with the sect
+files of earlier runs, keyed on the contents of the input files (the text and fact files,
+or the xml file), the collection and language settings and a fingerprint of the parser
+code and of normheader.sem_types. For documents that are found in the cache the sect file
+is copied from the cache without parsing. The cache is not used with -h or --debug. At
+the end of a run, the least recently used sect files are removed from the cache if it is
+larger than the --cache-size in megabytes (1024 by default), and a line with the number
+of files in the cache and the hit rate is printed. See utils/cache.py.
+
+Text, fact and sect files can be compressed with gzip or zstd in all forms, zstd needs
+the zstandard module. Compressed input files are recognized from their contents, and a
+sect file is compressed if its name ends in .gz or .zst. In a directory, files like
+doc.txt.gz and doc.fact.gz are paired and give doc.sect.gz. See utils/compressed.py.
 
 If the -h option is specified, html versions of the fact file and the sect file will be
 created and saved as FACT_FILE.html and SECT_FILE.html.
@@ -48,10 +79,42 @@ options, but the -h option will be ignored. In both cases, whether the oprions
 are specified or not, the language and collection are assumed to be the saem for
 all files in the list or directory.
 
-Finally, in the fifth form, a simple sanity check is run, where four files (one
+Each line in FILE_LIST has a text file, a fact file and a sect file, separated by
+whitespace, empty lines and lines starting with # are skipped. Errors are caught for each
+document, so a malformed line or a document that fails does not stop the run. A line is
+printed for each document, in the order of the list, with the stage and the error for
+failed documents, followed by a summary. The failed documents are written to
+FILE_LIST.failed, with comment lines for the stage and the error, and that file can be
+handed in as a FILE_LIST to process just the failed documents again. When all documents
+succeed, no such file is written and an old one is removed.
+
+With [-j N], the documents in a file list or a directory are processed by a pool of N
+worker processes, each with its own parser and factories, and the .sect files are
+written where they are written in a single process. Progress lines are still printed in
+the order of the files. When the collection is not given with -c, it is taken from the
+first fact file that has one before the workers start, so all workers use the same
+collection, as in a single process. Headers that workers add to the header table are
+sent back to the main process, which saves the table at the end.
+
+With [--manifest FILE], the documents in a directory that are completed are added to
+FILE, with the modification times, sizes and hashes of their input files. When the run
+is started again with the same manifest, documents that are listed in it are skipped if
+their sect file exists and their input files did not change, so an interrupted run only
+processes the documents that were not done yet. See utils/manifest.py.
+
+In the fifth form, the documents are read from ARCHIVE, a tar file (.tar, .tar.gz, .tgz or
+.tar.bz2), a zip file or a gzipped xml file, without extracting it. Pairs of .txt and
+.fact members and .xml members are parsed in memory, xml members as with --standoff
+NATIVE. The .sect files are written to OUTPUT, which is an archive if it ends in one of
+the tar or zip extensions and a directory otherwise, with the paths that the documents
+have in ARCHIVE. Errors are caught and printed for each document. The -j, --cache and
+--manifest options are not used in this form. See utils/archive.py.
+
+Finally, in the sixth form, a simple sanity check is run, where four files (one
 pubmed, one mockup Elsevier, one mockup WOS and one patent) are processed and
 the diffs between the resulting .sect files and the regression files are printed
-to the standard output.
+to the standard output. It also checks that a second run over the same text and fact
+files takes all .sect files from a result cache.
 
 If the code fails the regression test, the coder is responsible for checking why
 that happened and do one of two things: (i) change the code if a bug was
@@ -61,32 +124,55 @@ legitimate changes to the output.
 """
 
 
-import os, sys, codecs, re, getopt, difflib
-import elsevier1, elsevier2, pubmed, wos, lexisnexis, cnki
-import utils.view
-from readers.common import load_data, open_write_file
-from utils.xml import transform_tags_file
+import os, sys, codecs, re, getopt, difflib, itertools, multiprocessing, StringIO
+import shutil, tempfile
+import elsevier1, elsevier2, pubmed, wos, lexisnexis, cnki, normheader
+import utils.view, utils.archive
+from readers.common import FactFile, load_data, open_write_file
+from utils.xml import transform_tags_file, standoff
 from utils.misc import run_shell_commands
-
-DEBUG = False
+from utils.cache import ResultCache, MAXIMUM_SIZE
+from utils.manifest import Manifest
+from utils.compressed import compression, split_extension
+
+STANDOFF_MODES = ('XSLT', 'NATIVE')
+
+# The documents used by the regression test, run with the -t option, as pairs of the
+# directory in data/in and the name of the document
+TEST_FILES = (
+    ('pubmed', 'f401516f-bd40-11e0-9557-52c9fc93ebe0-001-gkp847'),
+    ('pubmed', 'pubmed-mm-test'),
+    ('elsevier', 'elsevier-simple'),
+    ('elsevier', 'elsevier-complex'),
+    ('lexisnexis', 'US4192770A'),
+    ('lexisnexis', 'US4192770A.xml'),
+    ('lexisnexis', 'US4504220A'),
+    ('wos', 'wos')
+    )
 
 
 def usage():
     print "\nUsage:"
     print '  % python main.py [-h] [-c COLLECTION] [-l LANGUAGE] ' \
           + 'TEXT_FILE FACT_FILE STRUCTURE_FILE'
-    print '  % python main.py [-h] [-c COLLECTION] [-l LANGUAGE] ' \
+    print '  % python main.py [-h] [--standoff MODE] [-c COLLECTION] [-l LANGUAGE] ' \
           + 'XML_FILE TEXT_FILE TAGS_FILE FACT_FILE STRUCTURE_FILE'
-    print '  % python main.py [-c COLLECTION] [-l LANGUAGE] FILE_LIST'
-    print '  % python main.py [-c COLLECTION] [-l LANGUAGE] DIRECTORY'
+    print '  % python main.py [-c COLLECTION] [-l LANGUAGE] [-j N] FILE_LIST'
+    print '  % python main.py [-c COLLECTION] [-l LANGUAGE] [-j N] [--manifest FILE] ' \
+          + 'DIRECTORY'
+    print '  % python main.py [-c COLLECTION] [-l LANGUAGE] ARCHIVE OUTPUT'
     print '  % python main.py -o [-l LANGUAGE] XML_FILE TEXT_FILE ' \
           + 'TAGS_FILE FACT_FILE STRUCTURE_FILE ONTO_FILE'
     print '  % python main.py -t'
 
 
-def create_fact_file(xml_file, text_file, tags_file, fact_file):
+def create_fact_file(xml_file, text_file, tags_file, fact_file, standoff_mode='XSLT'):
     """Given an xml file, first create text and tags files using the xslt standoff scripts and
-    then create a fact file."""
+    then create a fact file. With the NATIVE standoff mode, the text file and the fact file
+    are written directly from utils.xml.standoff() and no tags file is created."""
+    if standoff_mode == 'NATIVE':
+        write_standoff_data(standoff(xml_file), text_file, fact_file)
+        return
     # TODO: find a better way to do this, I want to use execfile to put the document
     # parser into a namespace, but then the __file__ variable is not available anymore
     dirname = os.path.dirname(__file__)
@@ -99,136 +185,405 @@ def create_fact_file(xml_file, text_file, tags_file, fact_file):
     transform_tags_file(tags_file, fact_file)
 
 
+def write_standoff_data(data, text_file, fact_file):
+    """Write the text and the fact lines as returned by utils.xml.standoff() to the text
+    file and the fact file."""
+    (text, fact_lines) = data
+    fh = open_write_file(text_file)
+    fh.write(text)
+    fh.close()
+    fh = open_write_file(fact_file)
+    for line in fact_lines:
+        fh.write(line + u"\n")
+    fh.close()
+
+
 class Parser(object):
 
     def __init__(self):
         self.test_mode = False
         self.html_mode = False
         self.onto_mode = False
+        self.debug = False
+        self.cache = None
+        self.manifest = None
+        self.standoff_mode = 'XSLT'
         self.collection = None
         self.language = None
+        self.jobs = 1
+        self.stage = None
 
     def __str__(self):
         return "<Parser for %s on %s>" % (self.language, self.collection)
 
-    def process_file(self, text_file, fact_file, sect_file, fact_type='BAE', verbose=False):
+    def process_file(self, text_file, fact_file, sect_file, fact_type='BAE', verbose=False,
+                     data=None, strict=False):
         """
         Takes a text file and a fact file and creates a sect file with the section data.
         The data in fact_file can have two formats: (i) the format generated by the BAE
         wrapper with fact_type=BAE and (ii) the format generated by utils/standoff with
-        fact_type=BASIC. """
-        self._create_factory(text_file, fact_file, sect_file, fact_type, verbose)
+        fact_type=BASIC. If data is given, it is a pair of the text and the fact lines and
+        the text file and fact file are not read. If a result cache is used, the sect file
+        is taken from the cache if the same files were processed before with the same
+        settings and the same code. Returns True if the sect file was created. The stage
+        that is being worked on is kept in self.stage, so that callers can report where
+        an error happened, see _process_file()."""
+        self.stage = 'factory'
+        key = None
+        if data is None and self.cache is not None:
+            # settle the collection before the key is made, otherwise the first document
+            # of a run gets a key without the collection that is used for it
+            self._detect_collection([(text_file, fact_file, sect_file)])
+            key = self._cache_key([text_file, fact_file], sect_file, fact_type, verbose)
+        if key is not None and self.cache.fetch(key, sect_file):
+            return True
+        if self._process_file(text_file, fact_file, sect_file, fact_type, verbose, data,
+                              strict):
+            if key is not None:
+                self.stage = 'cache'
+                self.cache.store(key, sect_file)
+            return True
+        return False
+
+    def _process_file(self, text_file, fact_file, sect_file, fact_type, verbose, data,
+                      strict=False):
+        """Does the work for process_file(), without the cache, returns False if the
+        sections could not be created. The stages are factory, sections, output and html.
+        A UserWarning is printed, unless strict is True, in which case it is raised like
+        any other error."""
+        self.stage = 'factory'
+        self._create_factory(text_file, fact_file, sect_file, fact_type, verbose, data)
         try:
+            self.stage = 'sections'
             self.factory.make_sections()
+            self.stage = 'output'
             self.factory.print_sections()
             if self.html_mode:
-                fact_file_html = 'data/html/' + os.path.basename(fact_file) + '.html'
-                sect_file_html = 'data/html/' + os.path.basename(sect_file) + '.html'
-                utils.view.createHTML(text_file, fact_file, fact_file_html)
-                utils.view.createHTML(text_file, sect_file, sect_file_html)
+                self.stage = 'html'
+                self._write_html(text_file, fact_file, sect_file)
             #self.factory.print_hierarchy()
         except UserWarning:
+            if strict:
+                raise
             print 'WARNING:', sys.exc_value
+            return False
+        return True
+
+    def _cache_key(self, input_files, sect_file, *settings):
+        """Returns the key of the input files in the result cache, or None if there is no
+        cache. The collection, the language, the compression of the sect file and the
+        other settings handed in are part of the key, so the collection should be settled
+        before this is called. The cache is not used with html files or when debugging,
+        since then other files than the sect file are created."""
+        if self.cache is None or self.html_mode or self.debug:
+            return None
+        settings = (self.collection, self.language, compression(sect_file, 'w')) + settings
+        return self.cache.key(input_files, settings)
+
+    def _write_html(self, text_file, fact_file, sect_file):
+        fact_file_html = 'data/html/' + os.path.basename(fact_file) + '.html'
+        sect_file_html = 'data/html/' + os.path.basename(sect_file) + '.html'
+        utils.view.createHTML(text_file, fact_file, fact_file_html)
+        utils.view.createHTML(text_file, sect_file, sect_file_html)
 
     def process_xml_file(self, xml_file, text_file, tags_file, fact_file, sect_file,
-                         verbose=False, debug=True):
+                         verbose=False, debug=False):
         """
-        Takes an xml file and creates sect file, while generating some intermediate data."""
-        if debug:
-            global DEBUG
-            DEBUG = True
-        create_fact_file(xml_file, text_file, tags_file, fact_file)
-        self.process_file(text_file, fact_file, sect_file, fact_type='BASIC', verbose=verbose)
+        Takes an xml file and creates sect file, while generating some intermediate data.
+        In the NATIVE standoff mode, the intermediate data stay in memory and the text file
+        and fact file are only written if debugging or if html files are created. The
+        result cache is used as with process_file(), with the xml file as the input."""
+        debug = debug or self.debug
+        key = None
+        if not debug:
+            # the fact lines made from an xml file have no collection, so the collection
+            # in the key can only come from -c and is the same for all documents
+            key = self._cache_key([xml_file], sect_file, 'BASIC', verbose,
+                                  self.standoff_mode)
+        if key is not None and self.cache.fetch(key, sect_file):
+            return
+        data = None
+        if self.standoff_mode == 'NATIVE':
+            data = standoff(xml_file)
+            if debug or self.html_mode:
+                write_standoff_data(data, text_file, fact_file)
+        else:
+            create_fact_file(xml_file, text_file, tags_file, fact_file)
+        if self._process_file(text_file, fact_file, sect_file, 'BASIC', verbose, data):
+            if key is not None:
+                self.cache.store(key, sect_file)
         # cleanup intermediary files, to keep them, use the --debug option
-        if not DEBUG:
+        if not debug:
             for filename in (text_file, tags_file, fact_file):
-                os.remove(filename)
+                if os.path.exists(filename):
+                    os.remove(filename)
 
     def process_directory(self, path):
         """
         Processes all files in a directory with text and fact files. Takes all .txt files,
-        finds sister files with extension .fact and then creates .sect files."""
+        finds sister files with extension .fact and then creates .sect files. Text and
+        fact files can be compressed, with a .gz or .zst extension after .txt and .fact,
+        and the sect file gets the same compression as the text file."""
         # TODO: add --xml option for directories with only xml files
         text_files = []
         fact_files= {}
         for f in os.listdir(path):
-            if f.endswith('.txt'): text_files.append(f)
-            if f.endswith('.fact'): fact_files[f] = True
+            name = split_extension(f)[0]
+            if name.endswith('.txt'): text_files.append(f)
+            if name.endswith('.fact'): fact_files[name] = f
         total_files = len(text_files)
         file_number = 0
         print "Processing %d files" % total_files
+        documents = []
         for text_file in text_files:
             file_number += 1
-            fact_file = text_file[:-4] + '.fact'
-            sect_file = text_file[:-4] + '.sect'
-            if fact_files.has_key(fact_file):
+            (name, extension) = split_extension(text_file)
+            fact_file = fact_files.get(name[:-4] + '.fact')
+            sect_file = name[:-4] + '.sect' + extension
+            if fact_file is not None:
                 text_file = os.path.join(path, text_file)
                 fact_file = os.path.join(path, fact_file)
                 sect_file = os.path.join(path, sect_file)
-                print "Processing %d of %d: %s" % (file_number, total_files, text_file[:-4])
-                self.process_file(text_file, fact_file, sect_file)
+                documents.append((file_number, (text_file, fact_file, sect_file)))
+        self.process_documents(documents, total_files)
+
+    def process_documents(self, documents, total_files):
+        """
+        Processes documents, a list of pairs of a file number and a triple of text, fact
+        and sect files, with a progress line for each document that uses the file number
+        and total_files. Uses a pool of worker processes if self.jobs is larger than one.
+        If there is a manifest, documents that it lists as done are skipped and
+        documents that are completed are added to it. This is done in this process, also
+        when there are workers, so there is only one process writing the manifest."""
+        if self.manifest is not None:
+            todo = []
+            for file_number, files in documents:
+                if self.manifest.is_done(files[:2], files[2]):
+                    print "Skipping %d of %d: %s" % (file_number, total_files, document_name(files[0]))
+                else:
+                    todo.append((file_number, files))
+            documents = todo
+        if self.jobs > 1:
+            results = self._pool_results('process_file', [files for (n, files) in documents])
+            for (file_number, files), completed in itertools.izip(documents, results):
+                print "Processing %d of %d: %s" % (file_number, total_files, document_name(files[0]))
+                if completed and self.manifest is not None:
+                    self.manifest.record(files[:2], files[2])
+            return
+        for file_number, files in documents:
+            print "Processing %d of %d: %s" % (file_number, total_files, document_name(files[0]))
+            completed = self.process_file(*files)
+            if completed and self.manifest is not None:
+                self.manifest.record(files[:2], files[2])
+
+    def _pool_results(self, method, documents):
+        """
+        Runs a method of the Parser on each of the triples of text, fact and sect files in
+        documents, with a pool of self.jobs worker processes, and generates the results.
+        Each worker gets its own Parser with the settings of this one. Results come back
+        in the order of the documents, so progress lines can be printed in the same order
+        as for a run in one process, but they are printed when a document is done. The
+        updates to the header table and the counts of the result cache in the workers are
+        merged here."""
+        self._detect_collection(documents)
+        cache = None
+        if self.cache is not None:
+            cache = (self.cache.directory, self.cache.maximum_size)
+        settings = (self.collection, self.language, self.html_mode, self.standoff_mode,
+                    self.debug, cache)
+        pool = multiprocessing.Pool(self.jobs, _init_worker, (settings,))
+        try:
+            tasks = [(method, files) for files in documents]
+            results = pool.imap(_run_in_worker, tasks)
+            pool.close()
+            for (result, table_updates, cache_updates) in results:
+                normheader.merge_table_updates(table_updates)
+                if cache_updates is not None:
+                    self.cache.merge(cache_updates)
+                yield result
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def _detect_collection(self, documents):
+        """
+        If no collection was given, take it from the first fact file in documents that has
+        one, as a run in one process does. This is done before the workers are started, so
+        that all workers use the same collection and the output does not depend on how the
+        documents are spread over the workers. Fact files that cannot be read are left to
+        the workers, which report them for their document."""
+        for files in documents:
+            if self.collection is not None:
+                return
+            try:
+                self._determine_collection(FactFile(files[1]))
+            except (IOError, OSError):
+                continue
 
     def process_files(self, file_list):
         """
         Takes a file with names of input and output files and processes them. Each line in the
         file has three filenames, separated by tabs, the first file is the text inut file, the
-        second the fact input file, and the third the output file."""
+        second the fact input file, and the third the output file. Errors are caught for
+        each line, the failures are printed and written to a failure log, which is a file
+        list itself. The log is only written if there are failures, a log left by an
+        earlier run is removed if there are none. Returns the list of failures, each a
+        tuple of the line number, the line, the stage and the error."""
         # TODO: may want to extend this to XML files
-        for line in open(file_list):
-            (text_file, fact_file, sections_file) = line.strip().split()
-            #print "Processing  %s" % (text_file[:-4])
-            self.process_file(text_file, fact_file, sections_file)
+        entries = []
+        for line_number, line in enumerate(open(file_list)):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.split()
+            if len(fields) != 3:
+                error = "expected 3 file names, found %d" % len(fields)
+                entries.append((line_number + 1, line, None, ('input', error)))
+            else:
+                entries.append((line_number + 1, line, tuple(fields), None))
+        documents = [files for (n, l, files, f) in entries if files is not None]
+        if self.jobs > 1:
+            results = self._pool_results('_process_listed_file', documents)
+        else:
+            results = (self._process_listed_file(*files) for files in documents)
+        failures = []
+        total = len(entries)
+        for count, (line_number, line, files, failure) in enumerate(entries):
+            if files is not None:
+                failure = results.next()
+            print "Processing %d of %d: %s" % (count + 1, total, line.split()[0])
+            if failure is not None:
+                print "   FAILED in %s: %s" % failure
+                failures.append((line_number, line) + failure)
+        failure_log = file_list + '.failed'
+        print "Processed %d documents: %d succeeded, %d failed" \
+              % (total, total - len(failures), len(failures))
+        if failures:
+            write_failure_log(failures, failure_log)
+            print "Failed documents are listed in", failure_log
+        elif os.path.exists(failure_log):
+            # the log of an earlier run is stale now that all documents succeeded
+            os.remove(failure_log)
+        return failures
+
+    def _process_listed_file(self, text_file, fact_file, sect_file):
+        """
+        Runs process_file(), but errors are caught and returned as a pair of the stage
+        where the error happened and the error message, and a UserWarning counts as an
+        error. Returns None if the document was processed or taken from the cache."""
+        try:
+            self.process_file(text_file, fact_file, sect_file, 'BAE', False, strict=True)
+        except Exception:
+            error = "%s: %s" % (sys.exc_type.__name__, sys.exc_value)
+            return (self.stage, ' '.join(error.split()))
+        return None
 
-    def _create_factory(self, text_file, fact_file, sect_file, fact_type, verbose=False):
+    def process_archive(self, archive, output):
+        """
+        Processes all documents in a tar, zip or gzip archive without extracting them, see
+        utils/archive.py. The members are paired and parsed in memory and the sect files
+        are written to output, which is a directory or an archive, under the names of the
+        documents in the input archive. Errors are caught for each document and printed,
+        as with process_files(). Returns the list of failures, each a tuple of the name of
+        the document, the stage and the error."""
+        writer = utils.archive.SectWriter(output)
+        (failures, skipped) = ([], [])
+        count = 0
+        try:
+            for name, members in utils.archive.documents(archive, skipped):
+                count += 1
+                print "Processing %d: %s" % (count, name)
+                (sect, failure) = self._process_archived_document(name, members)
+                if failure is not None:
+                    print "   FAILED in %s: %s" % failure
+                    failures.append((name,) + failure)
+                else:
+                    writer.write(name + '.sect', sect)
+        finally:
+            writer.close()
+        print "Processed %d documents: %d succeeded, %d failed" \
+              % (count, count - len(failures), len(failures))
+        if skipped:
+            print "Skipped %d members without a .txt or .fact sister" % len(skipped)
+        return failures
+
+    def _process_archived_document(self, name, members):
+        """
+        Creates the sections for a document from an archive, where members is a dictionary
+        with the contents of the .txt and .fact members or of the .xml member. The text
+        and the fact lines are handed to the factory as in-memory data, for an xml member
+        they are created with utils.xml.standoff(). Returns a pair of the contents of the
+        sect file and None, or of None and the stage and error of a failure."""
+        stage = 'factory'
+        try:
+            if 'xml' in members:
+                data = standoff(StringIO.StringIO(members['xml']))
+                fact_type = 'BASIC'
+            else:
+                text = members['txt'].decode('utf-8')
+                data = (text, StringIO.StringIO(members['fact']).readlines())
+                fact_type = 'BAE'
+            self._create_factory(name + '.txt', name + '.fact', name + '.sect', fact_type,
+                                 data=data)
+            stage = 'sections'
+            self.factory.make_sections()
+            stage = 'output'
+            sect = utils.archive.MemoryFile()
+            self.factory.print_sections(codecs.getwriter('utf-8')(sect))
+        except Exception:
+            error = "%s: %s" % (sys.exc_type.__name__, sys.exc_value)
+            return (None, (stage, ' '.join(error.split())))
+        return (sect.getvalue(), None)
+
+    def _create_factory(self, text_file, fact_file, sect_file, fact_type, verbose=False,
+                        data=None):
         """
         Returns the factory needed given the collection parameter and specifications in the
-        fact file and, if needed, some characteristics gathered from the text file."""
-        self._determine_collection(fact_file)
+        fact file and, if needed, some characteristics gathered from the text file. The
+        fact file is read once into a FactFile, which is handed to the factory together
+        with the in-memory data, if any."""
+        fact_lines = None if data is None else data[1]
+        facts = FactFile(fact_file, fact_type, fact_lines)
+        self._determine_collection(facts)
+        language = self.language if self.language is not None else facts.language
+        args = (text_file, fact_file, sect_file, fact_type, language, verbose)
         if self.collection == 'PUBMED':
-            self.factory = pubmed.BiomedNxmlSectionFactory(
-                text_file, fact_file, sect_file, fact_type, self.language, verbose)
+            self.factory = pubmed.BiomedNxmlSectionFactory(*args, data=data, facts=facts)
         elif self.collection == 'WEB_OF_SCIENCE':
-            self.factory = wos.WebOfScienceSectionFactory(
-                text_file, fact_file, sect_file, fact_type, self.language, verbose)
+            self.factory = wos.WebOfScienceSectionFactory(*args, data=data, facts=facts)
         elif self.collection == 'LEXISNEXIS':
-            self.factory = lexisnexis.PatentSectionFactory(
-                text_file, fact_file, sect_file, fact_type, self.language, verbose)
+            self.factory = lexisnexis.PatentSectionFactory(*args, data=data, facts=facts)
         elif self.collection == 'CNKI':
-            self.factory = cnki.CnkiSectionFactory(
-                text_file, fact_file, sect_file, fact_type, self.language, verbose)
+            self.factory = cnki.CnkiSectionFactory(*args, data=data, facts=facts)
         elif self.collection == 'ELSEVIER':
-            self.factory = self._create_elsevier_factory(
-                text_file, fact_file, sect_file, fact_type, verbose)
+            self.factory = self._create_elsevier_factory(facts, data, *args)
         else:
             raise Exception("No factory could be created")
 
-    def _create_elsevier_factory(self, text_file, fact_file, sect_file,
-                             fact_type, verbose=False):
+    def _create_elsevier_factory(self, facts, data, text_file, fact_file, sect_file,
+                                 fact_type, language, verbose=False):
         """
         Since Elsevier data come in two flavours and each flavour has its own factory, check
         the file to make sure what kind of Elsevier document we are dealing with. It appears
         that counting occurrences of the TEXT type in the fact file predicts whether an
         Elsevier file is structured or not with a precision of about 0.99."""
-        fh = open(fact_file)
-        text_tags = len( [l for l in fh.readlines() if l.find('TEXT') > -1] )
-        fh.close()
-        if text_tags < 4 :
+        if facts.text_lines < 4 :
             return elsevier1.SimpleElsevierSectionFactory(
-                text_file, fact_file, sect_file, fact_type, self.language)
+                text_file, fact_file, sect_file, fact_type, language, data=data,
+                facts=facts)
         else:
             return elsevier2.ComplexElsevierSectionFactory(
-                text_file, fact_file, sect_file, fact_type, self.language, verbose)
+                text_file, fact_file, sect_file, fact_type, language, verbose, data=data,
+                facts=facts)
 
-    def _determine_collection(self, fact_file):
+    def _determine_collection(self, facts):
         """
-        Loop through the fact file in order to find the line that specifies the collection."""
+        Take the collection from the DOCUMENT line in the fact file, unless it was already
+        set."""
         if self.collection is None:
-            expr = re.compile('DOCUMENT.*COLLECTION="(\S+)"')
-            for line in open(fact_file):
-                result = expr.search(line)
-                if result is not None:
-                    self.collection = result.group(1)
-                    break
+            self.collection = facts.collection
 
     def ping(self):
         """Utility method to quickly see if it work, useful when calling this module from
@@ -247,19 +602,9 @@ class Parser(object):
         Runs a regression test on a couple of files. For all these files, there needs to
         be a sect file in data/regression and xml or txt/fact files in data/in in one of
         the four source directories."""
-        files = (
-            ('pubmed', 'f401516f-bd40-11e0-9557-52c9fc93ebe0-001-gkp847'),
-            ('pubmed', 'pubmed-mm-test'),
-            ('elsevier', 'elsevier-simple'),
-            ('elsevier', 'elsevier-complex'),
-            ('lexisnexis', 'US4192770A'),
-            ('lexisnexis', 'US4192770A.xml'),
-            ('lexisnexis', 'US4504220A'),
-            ('wos', 'wos')
-            )
         results = []
         self.html_mode = True
-        for collection, filename in files:
+        for collection, filename in TEST_FILES:
             self.run_test(collection, filename, results)
         for filename, sect_file, response, key_file, key in results:
             print "\n[%s]" % filename,
@@ -274,8 +619,40 @@ class Parser(object):
                 print '     ', key_file
             #for line in difflib.unified_diff(response, key, fromfile=sect_file, tofile=key_file):
             #    sys.stdout.write(line)
+        print "\n[result cache]",
+        if self.run_cache_test():
+            print "... \033[0;32mPassed\033[0m"
+        else:
+            print "... \033[0;31mFailed\033[0m"
+            print "\n   The second run did not take all sect files from the cache"
         print
 
+    def run_cache_test(self):
+        """
+        Processes the text and fact files of the test twice with a new result cache, in
+        the same way as two runs over an unchanged directory, without -c. Returns True if
+        all documents of the second run were taken from the cache and the sect files of
+        the two runs are the same."""
+        directory = tempfile.mkdtemp()
+        try:
+            documents = []
+            for collection, filename in TEST_FILES:
+                if not filename.endswith('.xml'):
+                    path = "data/in/%s/%s" % (collection, filename)
+                    sect_file = os.path.join(directory, filename + '.sect')
+                    documents.append((path + '.txt', path + '.fact', sect_file))
+            outputs = []
+            for run in (1, 2):
+                parser = Parser()
+                parser.cache = ResultCache(os.path.join(directory, 'cache'))
+                for files in documents:
+                    parser.process_file(*files)
+                outputs.append([open(files[2]).read() for files in documents])
+            return (parser.cache.hits == len(documents) and parser.cache.misses == 0
+                    and outputs[0] == outputs[1])
+        finally:
+            shutil.rmtree(directory)
+
     def run_test(self, collection, filename, results):
         # reset the collection every iteration, we are not using the collection argument
         # on purpose because we want to also test whether the code finds the collection in
@@ -310,6 +687,46 @@ class Parser(object):
         results.append((filename, sect_file, response, key_file, key))
 
 
+# The parser of a worker process in a parallel run, created by _init_worker().
+_worker_parser = None
+
+def _init_worker(settings):
+    global _worker_parser
+    _worker_parser = Parser()
+    (_worker_parser.collection, _worker_parser.language, _worker_parser.html_mode,
+     _worker_parser.standoff_mode, _worker_parser.debug, cache) = settings
+    if cache is not None:
+        _worker_parser.cache = ResultCache(*cache)
+
+def _run_in_worker(task):
+    """Run a method of the parser on a triple of text, fact and sect files in a worker
+    process, returns the result, the updates of the header table and the counts of the
+    result cache."""
+    (method, files) = task
+    result = getattr(_worker_parser, method)(*files)
+    sys.stdout.flush()
+    cache = _worker_parser.cache
+    return (result, normheader.table_updates(), None if cache is None else cache.updates())
+
+
+def document_name(text_file):
+    """Returns the name of a text file without the .txt extension and without the
+    compression extension, if any, for use in progress lines."""
+    return split_extension(text_file)[0][:-4]
+
+
+def write_failure_log(failures, filename):
+    """Write the failures from Parser.process_files() to a file that can be used as a
+    file list. Each failure has a comment line with the line number, the stage and the
+    error, followed by the line from the file list, which is commented out if it was
+    malformed."""
+    fh = open(filename, 'w')
+    for (line_number, line, stage, error) in failures:
+        fh.write("# line %d, %s: %s\n" % (line_number, stage, error))
+        fh.write("%s%s\n" % ('# ' if stage == 'input' else '', line))
+    fh.close()
+
+
 def restore_sentences(f, data_to_write):
     """Chinese data seem to be created using OCS and have <br> all over the place, often
     splitting segments. Since the segmenter takes one line at the time, we spend some time
@@ -357,19 +774,50 @@ def count_iterable(i):
 if __name__ == '__main__':
 
     try:
-        (opts, args) = getopt.getopt(sys.argv[1:], 'htc:l:', ['debug'])
+        (opts, args) = getopt.getopt(sys.argv[1:], 'htc:l:j:', ['debug', 'standoff=', 'headers=', 'cache=', 'cache-size=', 'manifest='])
     except getopt.GetoptError, err:
         print str(err)
         usage()
         sys.exit(2)
 
     parser = Parser()
+    header_table = None
+    (cache_directory, cache_size) = (None, MAXIMUM_SIZE)
+    manifest = None
     for opt, val in opts:
         if opt == '-t': parser.test_mode = True
         elif opt == '-h': parser.html_mode = True
         elif opt == '-c': parser.collection = val
         elif opt == '-l': parser.language = val
-        elif opt == '--debug': DEBUG = True
+        elif opt == '--debug': parser.debug = True
+        elif opt == '--standoff':
+            if val not in STANDOFF_MODES:
+                print "Unknown standoff mode:", val
+                usage()
+                sys.exit(2)
+            parser.standoff_mode = val
+        elif opt == '--headers': header_table = val
+        elif opt == '--cache': cache_directory = val
+        elif opt == '--manifest': manifest = val
+        elif opt == '--cache-size':
+            if not val.isdigit():
+                print "The cache size should be a number of megabytes:", val
+                usage()
+                sys.exit(2)
+            cache_size = int(val) * 1024 * 1024
+        elif opt == '-j':
+            if not val.isdigit() or int(val) < 1:
+                print "The number of jobs should be a positive integer:", val
+                usage()
+                sys.exit(2)
+            parser.jobs = int(val)
+
+    if header_table is not None:
+        normheader.use_table(header_table)
+    if cache_directory is not None:
+        parser.cache = ResultCache(cache_directory, cache_size)
+    if manifest is not None:
+        parser.manifest = Manifest(manifest)
 
     # run some simple tests
     if parser.test_mode:
@@ -394,6 +842,10 @@ if __name__ == '__main__':
         elif os.path.isfile(path):
             parser.process_files(path)
 
+    # process the documents in an archive, writing to a directory or another archive
+    elif len(args) == 2 and utils.archive.is_archive(args[0]):
+        parser.process_archive(*args)
+
     # by default
     else:
         text_file = "doc.txt"
@@ -401,3 +853,12 @@ if __name__ == '__main__':
         sect_file = "doc.sections"
         parser.collection = 'PUBMED'
         parser.process_file(text_file, fact_file, sect_file, verbose=False)
+
+    if header_table is not None:
+        print normheader.close_table().report()
+    if parser.cache is not None:
+        parser.cache.close()
+        print parser.cache.report()
+    if parser.manifest is not None:
+        parser.manifest.close()
+        print parser.manifest.report()
@@ -1,4 +1,4 @@
-import string,re
+import string,re,hashlib,sqlite3
 
 """
 Mapping from types to strings that indicate that type. First list is list
@@ -39,35 +39,274 @@ sem_types = {
     "Abstract": (["abstract"],["ion","e"])
     }
 
+# Maximum number of headers and normalized headers kept in the caches used by
+# header_to_types() and normed_types()
+CACHE_SIZE = 10000
+
+
 def header_to_types(section_head):
     """
     Takes a section header string, returns semantic types. """
-    return normed_types(norm_section_head(section_head))
+    head_types = _header_cache.get(section_head)
+    if head_types is None:
+        head_types = normed_types(norm_section_head(section_head))
+        _header_cache.add(section_head, head_types)
+    return list(head_types)
+
+# Note that re.UNICODE used to be handed to re.sub() as the count, so at most 32
+# characters are removed and \W does not match non-ascii letters. This is kept as it
+# was because changing it would change the types of some headers.
+NORM_PATTERN = re.compile(r'\W|\d')
+NORM_COUNT = re.UNICODE
 
 def norm_section_head(section_head):
     """
     Normalizes a section header string, stripping punctuation/numbers/
     whitespace/capitalization (possibly only punctuation and capitalization
     is necessary?)"""
-    section_head = section_head.lower()
-    section_head = re.sub(r'\W|\d', '', section_head, re.UNICODE)
-    return section_head
+    return NORM_PATTERN.sub('', section_head.lower(), NORM_COUNT)
 
 def normed_types(section_head):
     """
-    Takes a normalized section header string, returns semantic types. """
-    head_types = []
-    for sem_type in sem_types:
-        for ch_string in sem_types[sem_type][0]:
-            if ch_string in section_head:
-                excluded = False
-                for ex_string in sem_types[sem_type][1]:
-                    if ex_string in section_head:
-                        excluded = True
-                if not excluded:
-                    head_types.append(sem_type)
-                    break
-    if len(head_types) < 1:
-        #head_types.append("Other:"+section_head)
-        head_types.append("Other")
-    return head_types
+    Takes a normalized section header string, returns semantic types. Results are kept
+    in a bounded cache since the same headers show up over and over again, and in the
+    header table if one is used. """
+    head_types = _cache.get(section_head)
+    if head_types is None:
+        if _table is not None:
+            head_types = _table.get(section_head)
+            if head_types is None:
+                head_types = _matcher.types(section_head)
+                _table.add(section_head, head_types)
+        else:
+            head_types = _matcher.types(section_head)
+        _cache.add(section_head, head_types)
+    return list(head_types)
+
+def reset():
+    """Compile the matcher again and empty the cache, this is needed if sem_types was
+    changed after this module was loaded. The header table is emptied if it was made for
+    another version of sem_types."""
+    global _matcher, _cache, _header_cache
+    _matcher = HeaderMatcher(sem_types)
+    _cache = LRUCache(CACHE_SIZE)
+    _header_cache = LRUCache(CACHE_SIZE)
+    if _table is not None:
+        _table.validate(fingerprint(sem_types))
+
+def fingerprint(mapping):
+    """Returns a string that changes when the types or their strings change. The types
+    are taken in sorted order, so the fingerprint does not depend on the order in which
+    a dictionary happens to give its keys."""
+    items = [(sem_type, list(mapping[sem_type][0]), list(mapping[sem_type][1]))
+             for sem_type in sorted(mapping)]
+    return hashlib.md5(repr(items)).hexdigest()
+
+def use_table(filename):
+    """Use the header table in filename, which is created if it does not exist."""
+    global _table
+    _table = HeaderTable(filename, fingerprint(sem_types))
+    _cache.clear()
+    _header_cache.clear()
+    return _table
+
+def close_table():
+    """Save the header table and stop using it, returns the table."""
+    global _table
+    table = _table
+    if table is not None:
+        table.close()
+        _table = None
+        _cache.clear()
+        _header_cache.clear()
+    return table
+
+def table_updates():
+    """Return the updates of the header table since the last call, or None if no table
+    is used."""
+    return None if _table is None else _table.updates()
+
+def merge_table_updates(updates):
+    """Merge updates from table_updates() in another process into the header table."""
+    if _table is not None and updates is not None:
+        _table.merge(updates)
+
+
+class HeaderMatcher(object):
+
+    """
+    Finds the semantic types of normalized headers. All strings from the include and
+    exclude lists of the mapping are put in one regular expression, so each header is
+    scanned only once. A type is assigned if one of its include strings occurs in the
+    header and none of its exclude strings does, types are returned in the order that
+    iterating over the mapping gives, with "Other" if there are no types.
+
+    The expression is a lookahead, so it finds matches starting at every position,
+    including overlapping ones. Longer strings come first, so at each position the
+    longest string that matches is found. All shorter strings that match at that
+    position are prefixes of that one, they are added using self.prefixes. """
+
+    def __init__(self, mapping):
+        self.type_strings = []
+        strings = set()
+        for sem_type in mapping:
+            (includes, excludes) = mapping[sem_type]
+            self.type_strings.append((sem_type, frozenset(includes), frozenset(excludes)))
+            strings.update(includes)
+            strings.update(excludes)
+        strings = sorted(strings, key=lambda s: (-len(s), s))
+        self.prefixes = dict([(s, [p for p in strings if s.startswith(p)])
+                              for s in strings])
+        self.pattern = re.compile(
+            '(?=(%s))' % '|'.join([re.escape(s) for s in strings]))
+
+    def found_strings(self, section_head):
+        found = set()
+        for match in self.pattern.finditer(section_head):
+            found.update(self.prefixes[match.group(1)])
+        return found
+
+    def types(self, section_head):
+        found = self.found_strings(section_head)
+        head_types = [sem_type for (sem_type, includes, excludes) in self.type_strings
+                      if not found.isdisjoint(includes) and found.isdisjoint(excludes)]
+        if len(head_types) < 1:
+            #head_types.append("Other:"+section_head)
+            head_types.append("Other")
+        return head_types
+
+
+class LRUCache(object):
+
+    """
+    A dictionary with a maximum size that keeps the recently used entries. This is an
+    approximation of a least recently used cache that needs only dictionary operations.
+    Entries are added to a dictionary of recent entries, and when that one has grown to
+    half the size it replaces the dictionary of older entries, which is dropped. Entries
+    that are found in the older entries are moved to the recent ones. """
+
+    def __init__(self, size):
+        self.size = size
+        self.recent = {}
+        self.older = {}
+
+    def __len__(self):
+        return len(self.recent) + len(self.older)
+
+    def get(self, key):
+        value = self.recent.get(key)
+        if value is None:
+            value = self.older.get(key)
+            if value is not None:
+                self.add(key, value)
+        return value
+
+    def add(self, key, value):
+        if len(self.recent) >= self.size / 2:
+            self.older = self.recent
+            self.recent = {}
+        self.recent[key] = value
+
+    def clear(self):
+        self.recent = {}
+        self.older = {}
+
+
+class HeaderTable(object):
+
+    """
+    A table on disk with the types of normalized headers, so headers that were seen in
+    earlier runs do not have to be typed again. The table is an SQLite database with the
+    headers and their types and with the fingerprint of the sem_types mapping that was
+    used for the types. If the fingerprint does not match the one of the current mapping
+    all headers are removed. All headers are read when the table is opened, headers that
+    are added are written when the table is saved. The table counts hits and misses for
+    the lookups. """
+
+    def __init__(self, filename, fingerprint):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS headers (header TEXT PRIMARY KEY, types TEXT)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+        self.headers = dict(self.connection.execute("SELECT header, types FROM headers"))
+        self.added = {}
+        self.hits = 0
+        self.misses = 0
+        self.validate(fingerprint)
+
+    def __len__(self):
+        return len(self.headers)
+
+    def validate(self, fingerprint):
+        """Remove all headers if the table was made for another fingerprint."""
+        row = self.connection.execute(
+            "SELECT value FROM info WHERE key = 'fingerprint'").fetchone()
+        if row is None or row[0] != fingerprint:
+            self.connection.execute("DELETE FROM headers")
+            self.connection.execute(
+                "INSERT OR REPLACE INTO info VALUES ('fingerprint', ?)", (fingerprint,))
+            self.connection.commit()
+            self.headers = {}
+            self.added = {}
+
+    def get(self, header):
+        types = self.headers.get(_unicode(header))
+        if types is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return types.split('|')
+
+    def add(self, header, types):
+        header = _unicode(header)
+        self.headers[header] = self.added[header] = u'|'.join(types)
+
+    def updates(self):
+        """Return the headers added and the hits and misses counted since the last call
+        and start counting again. This is used by the worker processes of a parallel run,
+        which send their updates to the table in the main process."""
+        updates = (self.added, self.hits, self.misses)
+        (self.added, self.hits, self.misses) = ({}, 0, 0)
+        return updates
+
+    def merge(self, updates):
+        """Add the updates from the table of a worker process."""
+        (added, hits, misses) = updates
+        self.headers.update(added)
+        self.added.update(added)
+        self.hits += hits
+        self.misses += misses
+
+    def save(self):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO headers VALUES (?, ?)", self.added.items())
+        self.connection.commit()
+        self.added = {}
+
+    def close(self):
+        self.save()
+        self.connection.close()
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def report(self):
+        return "Header table %s: %d headers, %d of %d lookups found (%.1f%%)" \
+               % (self.filename, len(self.headers), self.hits, self.hits + self.misses,
+                  self.hit_rate() * 100)
+
+
+def _unicode(header):
+    """Normalized headers can be byte strings, the table stores them as unicode. Latin-1
+    maps each byte to one character, so this does not change which strings of sem_types
+    occur in the header."""
+    return header.decode('latin-1') if isinstance(header, str) else header
+
+
+_matcher = HeaderMatcher(sem_types)
+_cache = LRUCache(CACHE_SIZE)
+_header_cache = LRUCache(CACHE_SIZE)
+_table = None
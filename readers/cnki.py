@@ -17,23 +17,24 @@
 
 """
 
-from common import Tag, load_data
+from common import Tag, TagStore, load_data
 from common import tags_with_name, tags_with_type, tags_with_matching_type
+from common import structures_with_type
 
 
-def read_tags(text_file, fact_file, fact_type):
+def read_tags(text_file, fact_file, fact_type, data=None, facts=None):
     """Returns the text as a unicode string as well as a dictionary with the various kinds
-    of tags."""
-    (text, tags) = load_data(text_file, fact_file, fact_type)
+    of tags. If data is given, the text and fact lines are taken from it instead of from
+    the files, if facts is given, the tags are taken from that FactFile."""
+    (text, tags) = load_data(text_file, fact_file, fact_type, data, facts)
     if fact_type == 'BAE':
-        structures = tags_with_name(tags, 'STRUCTURE')
-        tag_dictionary = read_tags_bae(structures)
+        tag_dictionary = read_tags_bae(tags)
     else:
         tag_dictionary = read_tags_basic(tags)
     return (text, tag_dictionary)
 
 
-def read_tags_bae(structures):
+def read_tags_bae(taglist):
 
     def is_claim(text, claims_section):
         return text.attributes["TYPE"] == "TEXT" \
@@ -41,13 +42,13 @@ def read_tags_bae(structures):
             and text.end_index <= claims_section.end_index
 
     tags = {}
-    tags['headers'] = tags_with_type(structures, 'SECTITLE')
-    tags['paragraphs'] = tags_with_type(structures, 'TEXT')
-    tags['abstracts'] =  tags_with_type(structures, 'ABSTRACT')
-    tags['summaries'] = tags_with_type(structures, 'SUMMARY')
-    tags['related_applications'] = tags_with_type(structures, 'RELATED_APPLICATIONS')
-    tags['sections'] = tags_with_type(structures, 'TEXT_CHUNK')
-    tags['claims_sections'] = tags_with_type(structures, 'CLAIMS')
+    tags['headers'] = structures_with_type(taglist, 'SECTITLE')
+    tags['paragraphs'] = structures_with_type(taglist, 'TEXT')
+    tags['abstracts'] =  structures_with_type(taglist, 'ABSTRACT')
+    tags['summaries'] = structures_with_type(taglist, 'SUMMARY')
+    tags['related_applications'] = structures_with_type(taglist, 'RELATED_APPLICATIONS')
+    tags['sections'] = structures_with_type(taglist, 'TEXT_CHUNK')
+    tags['claims_sections'] = structures_with_type(taglist, 'CLAIMS')
 
     # move the paragraphs that are really claims
     if tags['claims_sections']:
@@ -86,7 +87,6 @@ def read_tags_basic(taglist):
     # the following are used in English patents, and many of them also in chinese and
     # german patents
     tags['meta_tags'] = meta_tags(taglist)
-    taglist = [t for t in taglist if t.name != 'date']
     tags['headers'] = tags_with_name(taglist, 'heading')
     tags['paragraphs'] = tags_with_name(taglist, 'fs:P')
     tags['abstracts'] =  tags_with_name(taglist, 'fs:AbstractBlock')
@@ -105,6 +105,11 @@ def read_tags_basic(taglist):
 def meta_tags(taglist):
     p1, p2 = 0, 0
     metatags = []
+    if isinstance(taglist, TagStore):
+        rows = []
+        for name in ('invention-title', 'publication-reference', 'date'):
+            rows.extend(taglist.rows_with_name(name))
+        taglist = taglist.tags_in_rows(sorted(rows))
     for t in taglist:
         if t.name == 'invention-title':
             metatags.append(t)
@@ -7,33 +7,97 @@ This module contains shared code for the reader modules.
 # TODO: there are still some duplications of code in readers/elsevier2.py
 
 
-import shlex, codecs
+import re
+from utils.compressed import open_file
 
 
-class Tag():
+# Regular expressions used by split_fact_line(). A token is a sequence of unquoted
+# characters, double-quoted strings, single-quoted strings and escaped characters, which
+# is what shlex.split() would glue together. Whitespace is what shlex considers
+# whitespace, and a quote or backslash that cannot start a token is an error. The simple
+# version is for the usual lines that only have double quotes.
+SIMPLE_FACT_TOKEN = re.compile(r'(?:[^ \t\r\n"]+|"[^"]*")+')
+FACT_TOKEN = re.compile(r"""((?:[^ \t\r\n"'\\]+|"(?:[^"\\]|\\[\s\S])*"|'[^']*'|\\[\s\S])+)"""
+                        r"""|[ \t\r\n]+|(["'\\])""")
+FACT_TOKEN_PIECE = re.compile(r"""[^"'\\]+|"((?:[^"\\]|\\[\s\S])*)"|'([^']*)'|\\([\s\S])""")
+DOUBLE_QUOTE_ESCAPE = re.compile(r'\\(["\\])')
+
+
+def split_fact_line(line):
+    """Split a line from a fact file into a list of tokens. Gives the same results as
+    shlex.split(), including raising ValueError on an unclosed quote or a trailing
+    backslash, but is much faster. Fact lines have no comments and usually no
+    escapes, so most lines can take the short route where quotes are simply removed."""
+    if "'" not in line and '\\' not in line and line.count('"') % 2 == 0:
+        return [token.replace('"', '') for token in SIMPLE_FACT_TOKEN.findall(line)]
+    tokens = []
+    for match in FACT_TOKEN.finditer(line):
+        token, error = match.groups()
+        if token is not None:
+            if '"' in token or "'" in token or '\\' in token:
+                token = FACT_TOKEN_PIECE.sub(_unquote_piece, token)
+            tokens.append(token)
+        elif error is not None:
+            if error == '\\':
+                raise ValueError("No escaped character")
+            raise ValueError("No closing quotation")
+    return tokens
+
+def _unquote_piece(match):
+    (double_quoted, single_quoted, escaped) = match.groups()
+    if double_quoted is not None:
+        return DOUBLE_QUOTE_ESCAPE.sub(r'\1', double_quoted)
+    if single_quoted is not None:
+        return single_quoted
+    if escaped is not None:
+        return escaped
+    return match.group(0)
+
+
+class Tag(object):
 
     """
     Contains information for individual lines in a fact file. The fact file can either
     contain the BAE-generated output or the complete standoff output as generated by
-    utils/standoff."""
+    utils/standoff.
+
+    There is one Tag for each line in a fact file, so tags use slots and intern their
+    names. The attributes are kept as a tuple of name=value fields and the attributes
+    dictionary is only created when it is asked for. Getting the offsets and using attr()
+    or get_type() do not need the dictionary."""
+
+    __slots__ = ('name', 'fact_type', 'start_index', 'end_index', '_fields', '_attributes')
 
     def __init__(self, text, fact_type):
-        split_text = shlex.split(text)
-        self.name = split_text[0]
+        split_text = split_fact_line(text)
+        self.name = intern_string(split_text[0])
         self.fact_type = fact_type
-        self.attributes = dict([x.split('=',1) for x in split_text[1:]])
+        self._fields = tuple(split_text[1:])
+        self._attributes = None
+        for field in self._fields:
+            if '=' not in field:
+                raise ValueError("attribute without a value: %s" % field)
         if fact_type == 'BASIC':
             p1 = self.get_basic_offset()
             length = self.get_basic_length()
             self.start_index = p1
             self.end_index = p1 + length if (p1 > -1 and length > -1) else -1
         if fact_type == 'BAE':
-            self.start_index = int(self.attributes.get("START", '-1'))
-            self.end_index = int(self.attributes.get("END", '-1'))
+            self.start_index = int(self.attr("START", '-1'))
+            self.end_index = int(self.attr("END", '-1'))
+
+    @property
+    def attributes(self):
+        """The dictionary of attributes, created from the fields when first needed."""
+        if self._attributes is None:
+            pairs = [field.split('=', 1) for field in self._fields]
+            self._attributes = dict([(intern_string(a), v) for (a, v) in pairs])
+            self._fields = None
+        return self._attributes
 
     def __str__(self):
         return "[%d %d %s type=%s]" % (self.start_index, self.end_index, self.name, 
-                                       self.attributes.get('TYPE', None))
+                                       self.attr('TYPE', None))
             
     def __len__(self):
         return self.end_index - self.start_index
@@ -49,21 +113,40 @@ class Tag():
         return doc[self.start_index:self.end_index]
 
     def attr(self, attr, default=None):
-        return self.attributes.get(attr, default)
+        if self._attributes is not None:
+            return self._attributes.get(attr, default)
+        # as with the dictionary, the last field with the attribute wins
+        prefix = attr + '='
+        value = default
+        for field in self._fields:
+            if field.startswith(prefix):
+                value = field[len(prefix):]
+        return value
 
     def get_type(self):
-        return self.attributes.get('TYPE', None)
+        return self.attr('TYPE', None)
 
     def set_type(self, type_value):
         self.attributes['TYPE'] = type_value
         
     def get_basic_offset(self):
-        keys = [a for a in self.attributes.keys() if a.endswith(':offset')]
-        return int(self.attr(keys[0], -1)) if keys else -1
+        return self._get_basic_value(':offset')
     
     def get_basic_length(self):
-        keys = [a for a in self.attributes.keys() if a.endswith(':length')]
-        return int(self.attr(keys[0], -1)) if keys else -1
+        return self._get_basic_value(':length')
+
+    def _get_basic_value(self, suffix):
+        """Return the integer value of the attribute whose name ends in suffix, for example
+        standoff:offset, without asking for the attributes dictionary."""
+        if self._attributes is not None:
+            keys = [a for a in self._attributes.keys() if a.endswith(suffix)]
+            return int(self.attr(keys[0], -1)) if keys else -1
+        value = -1
+        for field in self._fields:
+            (attr, attr_value) = field.split('=', 1)
+            if attr.endswith(suffix):
+                value = int(attr_value)
+        return value
     
     def is_contained_in(self, p1, p2):
         """Return True if self is contained in p1 and p2."""
@@ -84,17 +167,172 @@ class Tag():
             return True
         return False
 
-    
-def load_data(text_file, fact_file, fact_type='BAE'):
+
+class TagStore(object):
+
+    """
+    Indexed store for the tags of a document. The Tag instances are kept in file order,
+    their positions in that order are the rows. Names and types, where the type is the
+    TYPE attribute, are given ids, with id 0 for tags without a type, and the rows are
+    indexed on name id, on type id and on the combination of the two, so that all tags
+    with a given name and/or type can be found without scanning all tags. The store can
+    be used like a list of tags.
+
+    The index is created in one pass when the store is created and it is not updated
+    when a Tag is changed later, so readers that rename tags or change their type should
+    do all their lookups first."""
+
+    def __init__(self, tags=()):
+        self.tags = []
+        self.names = []
+        self.types = [None]
+        self.name_to_id = {}
+        self.type_to_id = {None: 0}
+        self.name_index = {}
+        self.type_index = {}
+        self.name_type_index = {}
+        for tag in tags:
+            self.append(tag)
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __iter__(self):
+        return iter(self.tags)
+
+    def __getitem__(self, i):
+        return self.tags[i]
+
+    def __str__(self):
+        return "<TagStore with %d tags>" % len(self.tags)
+
+    def append(self, tag):
+        row = len(self.tags)
+        name = tag.name
+        tagtype = tag.get_type()
+        name_id = self.name_to_id.get(name)
+        if name_id is None:
+            name_id = self.name_to_id[name] = len(self.names)
+            self.names.append(name)
+        type_id = self.type_to_id.get(tagtype)
+        if type_id is None:
+            type_id = self.type_to_id[tagtype] = len(self.types)
+            self.types.append(tagtype)
+        self.tags.append(tag)
+        self.name_index.setdefault(name_id, []).append(row)
+        if type_id:
+            self.type_index.setdefault(type_id, []).append(row)
+            self.name_type_index.setdefault((name_id, type_id), []).append(row)
+
+    def rows_with_name(self, tagname):
+        name_id = self.name_to_id.get(tagname)
+        return self.name_index.get(name_id, [])
+
+    def rows_with_type(self, tagtype, tagname=None):
+        type_id = self.type_to_id.get(tagtype)
+        if not type_id:
+            return []
+        if tagname is None:
+            return self.type_index.get(type_id, [])
+        name_id = self.name_to_id.get(tagname)
+        return self.name_type_index.get((name_id, type_id), [])
+
+    def rows_with_matching_type(self, tagtype, p1, p2, tagname=None):
+        """Returns the rows, in file order, where type[p1:p2] == tagtype."""
+        rows = []
+        for t in self.types[1:]:
+            if t[p1:p2] == tagtype:
+                rows.extend(self.rows_with_type(t, tagname))
+        return sorted(rows)
+
+    def tags_in_rows(self, rows):
+        tags = self.tags
+        return [tags[row] for row in rows]
+
+
+class FactFile(object):
+
+    """
+    The contents of a fact file, read once and shared by the code that decides what
+    factory to use and the factory itself. Has the lines of the file, the collection and
+    the language from the DOCUMENT lines, the number of lines that mention TEXT (which is
+    used to tell the two kinds of Elsevier documents apart), and the tags, which are
+    created when they are first asked for. The lines can also be handed in directly, for
+    example when they were created in memory from an xml file."""
+
+    COLLECTION_EXP = re.compile('DOCUMENT.*COLLECTION="(\S+)"')
+    LANGUAGE_EXP = re.compile('DOCUMENT.*LANGUAGE="(\S+)"')
+
+    def __init__(self, fact_file, fact_type='BAE', lines=None):
+        self.fact_file = fact_file
+        self.fact_type = fact_type
+        if lines is None:
+            fh = open_file(fact_file)
+            lines = fh.readlines()
+            fh.close()
+        else:
+            # use the same utf-8 encoded strings as the ones that are read from a fact
+            # file so that the attributes on the tags are the same
+            lines = [l.encode('utf-8') if isinstance(l, unicode) else l for l in lines]
+        self.lines = lines
+        self.collection = None
+        self.language = None
+        self.text_lines = 0
+        self._tags = {}
+        for line in lines:
+            if line.find('TEXT') > -1:
+                self.text_lines += 1
+            if line.find('DOCUMENT') > -1:
+                if self.collection is None:
+                    result = FactFile.COLLECTION_EXP.search(line)
+                    if result is not None:
+                        self.collection = result.group(1)
+                if self.language is None:
+                    result = FactFile.LANGUAGE_EXP.search(line)
+                    if result is not None:
+                        self.language = result.group(1)
+
+    def __str__(self):
+        return "<FactFile %s with %d lines>" % (self.fact_file, len(self.lines))
+
+    def tags(self, fact_type=None):
+        """Return the TagStore for the lines, using the fact type of the file unless
+        another one is given."""
+        if fact_type is None:
+            fact_type = self.fact_type
+        if not self._tags.has_key(fact_type):
+            self._tags[fact_type] = make_tags(self.lines, fact_type)
+        return self._tags[fact_type]
+
+
+def intern_string(s):
+    """Intern byte strings, in Python 2 this does not work for unicode strings."""
+    return intern(s) if type(s) is str else s
+
+def load_data(text_file, fact_file, fact_type='BAE', data=None, facts=None):
     """Returns a tuple of the text as a unicode string and a list of Tag instances created
-    from the fact file."""
-    text = codecs.open(text_file, encoding="utf-8").read()
+    from the fact file. If data is given, it is a pair of the text and a list of fact lines
+    that were created in memory (see utils.xml.standoff), and the files are not read. If
+    facts is given, it is the FactFile for fact_file and the tags are taken from it. The
+    files can be compressed, see utils/compressed.py."""
+    if data is not None:
+        text = data[0]
+        if facts is None:
+            facts = FactFile(fact_file, fact_type, data[1])
+    else:
+        text = open_file(text_file, encoding="utf-8").read()
+        if facts is None:
+            facts = FactFile(fact_file, fact_type)
+    return (text, facts.tags(fact_type))
+
+def make_tags(fact_lines, fact_type='BAE'):
+    """Returns a TagStore with the Tag instances created from an iterable of fact lines."""
     # tags = [ Tag(line, fact_type) for line in open(fact_file) if line.strip() != '' ]
     # The nice compact line above needed to be replaced with somehting more verbose since
     # some error handling was needed, this was added because USPP021257P2.fact in the fact
     # files for the 500 US sample patents in lexis.tgz is corrupted
-    tags = []
-    for line in open(fact_file):
+    tags = TagStore()
+    for line in fact_lines:
         if line.strip() != '':
             try:
                 tag = Tag(line, fact_type)
@@ -102,10 +340,16 @@ def load_data(text_file, fact_file, fact_type='BAE'):
             except Exception, e:
                 print "WARNING: could not make Tag instance from line"
                 print '         [', line.rstrip(), ']'
-    return (text, tags)
+    return tags
 
 def find_abstracts(tags):
     """Returns all tags that are abstract tags."""
+    if isinstance(tags, TagStore):
+        rows = tags.rows_with_type('ABSTRACT', 'STRUCTURE')
+        for name in tags.names:
+            if name.lower() == 'abstract':
+                rows = rows + tags.rows_with_name(name)
+        return tags.tags_in_rows(sorted(rows))
     return [ t for t in tags if t.is_abstract()]
 
 def load_articles(basename_file="files.txt"):
@@ -117,17 +361,37 @@ def load_articles(basename_file="files.txt"):
 
 def tags_with_name(tags, tagname):
     """Returns all elements from tags with name == tagname"""
+    if isinstance(tags, TagStore):
+        return tags.tags_in_rows(tags.rows_with_name(tagname))
     return [t for t in tags if t.name == tagname]
 
 def tags_with_type(tags, tagtype):
     """Returns all elements from tags with type == typename"""
+    if isinstance(tags, TagStore):
+        return tags.tags_in_rows(tags.rows_with_type(tagtype))
     return [t for t in tags if t.attributes["TYPE"] == tagtype]
 
 def tags_with_matching_type(tags, tagtype, p1, p2):
     """Returns all elements from tags with type[p1:p2] == typename"""
+    if isinstance(tags, TagStore):
+        return tags.tags_in_rows(tags.rows_with_matching_type(tagtype, p1, p2))
     return [t for t in tags if t.attributes["TYPE"][p1:p2] == tagtype]
 
+def structures_with_type(tags, tagtype):
+    """Returns all STRUCTURE elements from tags with type == typename"""
+    if isinstance(tags, TagStore):
+        return tags.tags_in_rows(tags.rows_with_type(tagtype, 'STRUCTURE'))
+    return tags_with_type(tags_with_name(tags, 'STRUCTURE'), tagtype)
+
+def structures_with_matching_type(tags, tagtype, p1, p2):
+    """Returns all STRUCTURE elements from tags with type[p1:p2] == typename"""
+    if isinstance(tags, TagStore):
+        rows = tags.rows_with_matching_type(tagtype, p1, p2, 'STRUCTURE')
+        return tags.tags_in_rows(rows)
+    return tags_with_matching_type(tags_with_name(tags, 'STRUCTURE'), tagtype, p1, p2)
+
 def open_write_file(filename, encoding='utf-8'):
-    """Open a file using codecs and return the filehandle."""
-    return codecs.open(filename, 'w', encoding)
+    """Open a file using codecs and return the filehandle, the file is compressed if its
+    name ends in .gz or .zst."""
+    return open_file(filename, 'w', encoding)
 
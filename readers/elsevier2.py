@@ -5,9 +5,9 @@ Source reading code for Elsevier structured documents.
 """
     
 
-import shlex, codecs
-from common import load_data, load_articles
-from common import tags_with_type
+import codecs, bisect
+from common import load_data, load_articles, split_fact_line
+from common import tags_with_type, structures_with_type, structures_with_matching_type
 
 class Tag():
 
@@ -16,7 +16,7 @@ class Tag():
     
     def __init__(self,text):
         try:
-            split_text=shlex.split(text)
+            split_text=split_fact_line(text)
         except ValueError:
             split_text=text.split()
         try:
@@ -73,9 +73,8 @@ def headed_sections(tags, doc_length, max_title_lead=50, separate_headers=True,
     """
 
     
-    structures = filter(lambda x: x.name == "STRUCTURE", tags)
-    title_structures = filter(lambda x: x.attributes["TYPE"] == "TITLE", structures)
-    text_structures = filter(lambda x: x.attributes["TYPE"][:4] == "TEXT", structures)
+    title_structures = structures_with_type(tags, "TITLE")
+    text_structures = structures_with_matching_type(tags, "TEXT", 0, 4)
 
     
     matches = []
@@ -83,6 +82,24 @@ def headed_sections(tags, doc_length, max_title_lead=50, separate_headers=True,
     
     title_structures = sorted(title_structures, key=lambda x: x.start_index)
     text_structures = sorted(text_structures, key=lambda x: x.start_index)
+    starts = [x.start_index for x in text_structures]
+    irregular = [i for (i, x) in enumerate(text_structures) if x.end_index < x.start_index]
+
+    def candidates(title, next_title):
+        """Return the indexes of the text structures that can go with the title. The
+        text structures are sorted on start offset, and a text structure can only go with
+        the title if it starts after the title start minus max_title_follow, and before
+        the title end plus max_title_lead or before the next title. So this is a slice of
+        text_structures, found with a binary search, plus the text structures that end
+        before they start. With separate_headers=False, start offsets of text structures
+        are changed while matching, so in that case all text structures are tried."""
+        if not separate_headers:
+            return range(len(text_structures))
+        first = bisect.bisect_right(starts, title.start_index - max_title_follow)
+        last = bisect.bisect_left(starts, max(title.end_index + max_title_lead,
+                                              next_title.start_index))
+        last = max(first, last)
+        return range(first, last) + irregular[bisect.bisect_left(irregular, last):]
 
     """OK so guesswork on what paragraphs go to what header.  We assume that if there is a period
     of unlabeled text in among labeled text it really should have gone with the previous label.
@@ -95,7 +112,8 @@ def headed_sections(tags, doc_length, max_title_lead=50, separate_headers=True,
         next_title = title_structures[index+1]
         titled_paras =[]
         titled_chunks = []
-        for text_structure in text_structures:
+        for text_index in candidates(title, next_title):
+            text_structure = text_structures[text_index]
             if (text_structure.attributes["TYPE"]=="TEXT_CHUNK"
                 and title.start_index < text_structure.start_index + max_title_follow
                 and text_structure.start_index - title.end_index < max_title_lead):
@@ -131,8 +149,7 @@ def headed_sections(tags, doc_length, max_title_lead=50, separate_headers=True,
     return matches
 
 def find_abstracts(tags):
-    structures = filter(lambda x: x.name == "STRUCTURE", tags)
-    return filter(lambda x: x.attributes["TYPE"] == "ABSTRACT", structures)
+    return structures_with_type(tags, "ABSTRACT")
 
 
 
@@ -1,6 +1,7 @@
-import shlex, codecs
+import codecs, bisect
 from common import Tag, load_data, find_abstracts
 from common import tags_with_name, tags_with_type, tags_with_matching_type
+from common import structures_with_type, structures_with_matching_type
 
     
 def headed_sections(tags, max_title_lead=30, separate_headers=True, max_title_follow=30):
@@ -13,49 +14,73 @@ def headed_sections(tags, max_title_lead=30, separate_headers=True, max_title_fo
     
     headers = tags_with_name(tags, "title")
     sections = tags_with_name(tags, "sec")
-    structures = tags_with_name(tags, "STRUCTURE")
-    title_structures = tags_with_type(structures, "TITLE")
-    text_structures = tags_with_matching_type(structures, "TEXT", 0, 4)
+    title_structures = structures_with_type(tags, "TITLE")
+    text_structures = structures_with_matching_type(tags, "TEXT", 0, 4)
 
     #print len(headers), len(sections), len(structures), len(title_structures), len(text_structures)
     
     matches = []
     header_matches = []
+
+    # a header goes with the first section in the sections list that starts where the
+    # header starts, so the sections are looked up on their start offset, in a table
+    # that keeps them in list order
+    sections_at = {}
+    for position, section in enumerate(sections):
+        sections_at.setdefault(section.start_index, []).append((position, section))
     for header in headers:
-        for section in sections:
-            if (header.start_index == section.start_index):
-                if separate_headers:
-                    section.start_index = header.end_index + 1
-                    header_matches.append(header)
-                matches.append((header, section))
-                break
+        candidates = sections_at.get(header.start_index)
+        if candidates:
+            (position, section) = candidates[0]
+            if separate_headers:
+                # the section moves to the end of the header, where it can still be
+                # matched by another header
+                candidates.pop(0)
+                section.start_index = header.end_index + 1
+                bisect.insort(sections_at.setdefault(section.start_index, []),
+                              (position, section))
+                header_matches.append(header)
+            matches.append((header, section))
+
+    # a text structure can only go with a title if it starts after the title start minus
+    # max_title_follow and before the title end plus max_title_lead, so the candidates
+    # are found with a binary search on the text structures sorted on start offset and
+    # are then put back in their original order. With separate_headers=False, start
+    # offsets of text structures are changed while matching, so all are tried.
+    order = sorted(range(len(text_structures)), key=lambda i: text_structures[i].start_index)
+    starts = [text_structures[i].start_index for i in order]
     for title in title_structures:
-        matching_structures=[]
-        for text_structure in text_structures:
+        if separate_headers:
+            first = bisect.bisect_right(starts, title.start_index - max_title_follow)
+            last = bisect.bisect_left(starts, title.end_index + max_title_lead)
+            candidates = [text_structures[i] for i in sorted(order[first:last])]
+        else:
+            candidates = text_structures
+        matching_structures = [
+            text_structure for text_structure in candidates
             if (title.start_index < text_structure.start_index + max_title_follow
-                and text_structure.start_index - title.end_index < max_title_lead):
-                matching_structures.append(text_structure)
+                and text_structure.start_index - title.end_index < max_title_lead)]
         #multiple things can map to a single title so we need to pick the best one
-        if len(matching_structures) >0:
-            best_structure=pick_best_structure(matching_structures)
-            if  separate_headers:
+        if len(matching_structures) > 0:
+            best_structure = pick_best_structure(matching_structures)
+            if separate_headers:
                 header_matches.append(title)
             else:
-                best_structure.start_index=title.start_index
+                best_structure.start_index = title.start_index
             matches.append((title, best_structure))
-                
-            
+
     matches.extend(header_matches)
     return matches
 
 def pick_best_structure(structures):
     """
     picks out the most appropriate structure to be associated with a given title.
-    current algorithm: choose smallest text_chunk or largest text.
+    current algorithm: choose smallest text_chunk or largest text. The type of each
+    structure is only looked up once.
     """
-    chunks=tags_with_type(structures, "TEXT_CHUNK")
-    texts=tags_with_type(structures, "TEXT")
+    types = [structure.get_type() for structure in structures]
+    chunks = [s for (s, t) in zip(structures, types) if t == "TEXT_CHUNK"]
     if len(chunks) > 0:
         return min(chunks, key=len)
     else:
-        return max(texts, key=len)
+        return max([s for (s, t) in zip(structures, types) if t == "TEXT"], key=len)
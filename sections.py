@@ -1,5 +1,9 @@
-import codecs
+import re, bisect, itertools
 from exceptions import UserWarning
+from utils.compressed import open_file
+
+
+NON_WHITESPACE = re.compile(r'\S', re.UNICODE)
 
 
 class Section(object):
@@ -7,28 +11,43 @@ class Section(object):
     Represents a semantically-typed section in a document. Should be used by all
     SectionFactories because the code to write to the output uses this
     class. The section does not include the header, but self.header does contain
-    the string of the header, if there is one. """
+    the string of the header, if there is one.
 
-    SECTION_ID = 0
-    
-    def __init__(self):
-        Section.SECTION_ID += 1
-        self.id = Section.SECTION_ID
+    Sections use slots since there can be many thousands of them for a patent. The
+    subsumers, subsumed and subsumer_types variables start out as empty tuples and only
+    become a list or set when link_sections() adds something to them. The header_types
+    variable is only set on some header sections.
+
+    The text of a section is usually not stored on the section. Instead, set_document()
+    hands in the string for the whole document and the text is sliced from it, using the
+    offsets of the section, only when the text property is used. The text can also be set
+    to a string directly, which is needed when it is not a stretch of the document.
+
+    Sections do not number themselves, the identifier is handed in when the section is
+    created, usually by SectionFactory.new_section(). """
+
+    __slots__ = ('id', 'parent_id', 'types', 'header', 'subsumers', 'subsumer_types',
+                 'subsumed', 'filename', 'start_index', 'end_index', '_text', '_document',
+                 'tag', 'header_types')
+
+    def __init__(self, section_id=None):
+        self.id = section_id
         self.parent_id = None
         self.types = []
         self.header = ""
-        self.subsumers = []
-        self.subsumer_types = set()
-        self.subsumed = []
+        self.subsumers = ()
+        self.subsumer_types = ()
+        self.subsumed = ()
         self.filename = ""
         self.start_index = -1
         self.end_index = -1
-        self.text = ""
+        self._text = ""
+        self._document = None
         self.tag = None
         
     def __str__(self):
         (p1, p2) = (self.start_index, self.end_index)
-        offsets = "id=%d pid=%s start=%d end=%d" % (self.id, self.parent_id, p1, p2)
+        offsets = "id=%s pid=%s start=%d end=%d" % (self.id, self.parent_id, p1, p2)
         types = "types='%s'" % '|'.join(self.types)
         header = " header='%s'" % self.header if self.header else ''
         tagname = 'nil' if self.tag is None else self.tag.name
@@ -37,6 +56,31 @@ class Section(object):
     def __len__(self):
         return self.end_index - self.start_index
 
+    @property
+    def text(self):
+        if self._text is None:
+            return self._document[self.start_index:self.end_index]
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        self._text = text
+        self._document = None
+
+    def set_document(self, document):
+        """Use the unicode string for the entire document as the source of the text."""
+        self._text = None
+        self._document = document
+
+    def has_text(self):
+        """Return True if the text has something other than whitespace in it, this does not
+        make a copy of the text if it is taken from the document."""
+        if self._text is None:
+            document = self._document
+            (start, end, step) = slice(self.start_index, self.end_index).indices(len(document))
+            return start < end and NON_WHITESPACE.search(document, start, end) is not None
+        return len(self._text.strip()) > 0
+
     def is_claim(self):
         return False
 
@@ -48,6 +92,18 @@ class Section(object):
     def set_parent_id(self):
         if self.subsumers:
             self.parent_id = self.subsumers[-1].id
+
+    def add_subsumer(self, other_section):
+        """Add a section that includes self, also adding self to the sections subsumed by
+        the other section."""
+        if not self.subsumers:
+            self.subsumers = []
+            self.subsumer_types = set()
+        self.subsumers.append(other_section)
+        self.subsumer_types.update(other_section.types)
+        if not other_section.subsumed:
+            other_section.subsumed = []
+        other_section.subsumed.append(self)
             
     def is_header(self):
         return self.types == ['Header']
@@ -67,15 +123,17 @@ class Section(object):
         text_string = self.text.replace("\n", '\\n').encode('utf-8')[:80]
         (p1, p2) = (self.start_index, self.end_index)
         (BLUE, GREEN, END) = ('\033[34m', '\033[32m', '\033[0m')
-        offsets = "%s<id=%d start=%d end=%d>%s" % (GREEN, self.id, p1, p2, END)
+        offsets = "%s<id=%s start=%d end=%d>%s" % (GREEN, self.id, p1, p2, END)
         types = "%s%s%s" % (BLUE, str(self.types), END)
         return "%s %s\n%s...\n" % (types, offsets, text_string)
     
 
 class ClaimSection(Section):
 
-    def __init__(self):
-        Section.__init__(self)
+    __slots__ = ('claim_number', 'parent_claims')
+
+    def __init__(self, section_id=None):
+        Section.__init__(self, section_id)
         self.claim_number = -1
         self.parent_claims = []
 
@@ -90,18 +148,26 @@ class SectionFactory(object):
     code. The main method called by outside code is make_sections(), which should be
     implemented on all subclasses."""
     
-    def __init__(self, text_file, fact_file, sect_file, fact_type, language, verbose=False):
+    def __init__(self, text_file, fact_file, sect_file, fact_type, language, verbose=False,
+                 data=None, facts=None):
         """
         The first two files are the ones that are given by the wrapper, the third is
-        the file that the wrapper expects."""
-        # reset the SECTION_ID class variable so that ids start at 1 for each file, this
-        # is important because it makes the regression test much more robust.
-        Section.SECTION_ID = 0
+        the file that the wrapper expects. The optional data argument is a pair of the text
+        and a list of fact lines created in memory, from an xml file or from the members of
+        an archive, all factories use it instead of the first two files, which are then
+        only used as names. The optional facts argument is a readers.common.FactFile that was already
+        created for the fact file, if it is given the fact file is not read again."""
+        # each factory numbers its own sections, so ids start at 1 for each file, this
+        # is important because it makes the regression test much more robust, and
+        # factories for different files can run at the same time
+        self.section_ids = itertools.count(1)
         self.language = language
         self.fact_type = fact_type
         self.text_file = text_file
         self.fact_file = fact_file
         self.sect_file = sect_file
+        self.data = data
+        self.facts = facts
         self.sections = []
         self.verbose = verbose
 
@@ -114,6 +180,23 @@ class SectionFactory(object):
         should implement this method. """        
         raise UserWarning, "make_sections() not implemented for %s " % self.__class__.__name__
 
+    def new_section(self, section_class=Section):
+        """Returns a new Section, or a new instance of section_class, with the next
+        identifier of this factory."""
+        return section_class(self.section_ids.next())
+
+    def read_text(self):
+        """Returns the text of the document, taken from the data if there are any."""
+        if self.data is not None:
+            return self.data[0]
+        return open_file(self.text_file, encoding='utf-8').read()
+
+    def fact_lines(self):
+        """Returns the lines of the fact file, taken from the FactFile if there is one."""
+        if self.facts is not None:
+            return self.facts.lines
+        return open_file(self.fact_file)
+
     def section_string(self, section, suppress_empty=True):
         """
         Called by print_sections. Returns a human-readable string with relevant
@@ -146,12 +229,14 @@ class SectionFactory(object):
                 sec_string += " PARENT_CLAIMS=" + self.parent_claims_string(section.parent_claims)
         except AttributeError:
             pass   
-        if self.verbose and len(section.text) > 0:
-            if len(section.text) < 2000:
-                sec_string += "\n"+section.text
-            else:
-                sec_string += "\n"+section.text[:900]+"  [...]  " + section.text[-900:]
-        if suppress_empty and len(section.text.strip()) < 1:
+        if self.verbose:
+            text = section.text
+            if len(text) > 0:
+                if len(text) < 2000:
+                    sec_string += "\n" + text
+                else:
+                    sec_string += "\n" + text[:900] + "  [...]  " + text[-900:]
+        if suppress_empty and not section.has_text():
             return None
         return sec_string + "\n"
 
@@ -163,9 +248,10 @@ class SectionFactory(object):
         return ret_string
     
     def print_sections(self, fh=None):
-        """ Prints section data to a file handle or the sections file. """
+        """ Prints section data to a file handle or the sections file, which is compressed
+        if its name ends in .gz or .zst. """
         if fh is None:
-            fh = codecs.open(self.sect_file, "w", encoding='utf-8')
+            fh = open_file(self.sect_file, "w", encoding='utf-8')
         for section in self.sections:
             try:
                 fh.write(self.section_string(section))
@@ -184,11 +270,92 @@ class SectionFactory(object):
         for subsection in section.subsumed:
             self.print_hierarchy_tree(subsection, indent+3)
 
-            
 
-def section_gaps(sections, text, filename=""):
+
+class SectionIndex(object):
+    """
+    An interval index on the offsets of a list of sections, built once and then used for
+    overlap tests, for finding gaps and for link_sections(). The sections are kept sorted
+    on start offset, with longer sections first for equal start offsets, which is the
+    order that link_sections() uses. For each position, max_ends has the largest end
+    offset of the sections up to that position, so the sections that overlap a stretch
+    of text are found with two binary searches. Sections added later are merged in."""
+
+    def __init__(self, sections=()):
+        self.sections = []
+        self.starts = []
+        self.max_ends = []
+        self.add(sections)
+
+    def __len__(self):
+        return len(self.sections)
+
+    def __iter__(self):
+        return iter(self.sections)
+
+    def add(self, sections):
+        """Add sections to the index. A few sections are inserted in place, more are
+        merged in by sorting again, either way sections with the same offsets stay in
+        the order they were added in."""
+        sections = list(sections)
+        if len(sections) > 8:
+            self.sections.extend(sections)
+            self.sections.sort(key=lambda s: (s.start_index, -s.end_index))
+            self.starts = [s.start_index for s in self.sections]
+            self.max_ends = []
+            max_end = None
+            for section in self.sections:
+                if max_end is None or section.end_index > max_end:
+                    max_end = section.end_index
+                self.max_ends.append(max_end)
+        else:
+            for section in sections:
+                self.insert(section)
+
+    def insert(self, section):
+        """Insert one section after the sections with the same offsets."""
+        (start, end) = (section.start_index, section.end_index)
+        position = bisect.bisect_left(self.starts, start)
+        last = bisect.bisect_right(self.starts, start, position)
+        while position < last and self.sections[position].end_index >= end:
+            position += 1
+        self.sections.insert(position, section)
+        self.starts.insert(position, start)
+        max_end = end if position == 0 else max(self.max_ends[position - 1], end)
+        self.max_ends.insert(position, max_end)
+        # the running maximum only changes for the following sections up to the first
+        # one that already has a larger maximum
+        for i in xrange(position + 1, len(self.max_ends)):
+            if self.max_ends[i] >= end:
+                break
+            self.max_ends[i] = end
+
+    def overlapping(self, start, end):
+        """Return the sections that share at least one character with the stretch from
+        start to end, that is, those that start before end and end after start."""
+        last = bisect.bisect_left(self.starts, end)
+        first = bisect.bisect_right(self.max_ends, start, 0, last)
+        return [s for s in self.sections[first:last] if s.end_index > start]
+
+    def gaps(self, end):
+        """Return the pairs of offsets of the stretches between 0 and end that are not
+        covered by any section."""
+        gaps = []
+        covered = 0
+        for section in self.sections:
+            if section.start_index > covered:
+                gaps.append((covered, section.start_index))
+            if section.end_index > covered:
+                covered = section.end_index
+        if end > covered:
+            gaps.append((covered, end))
+        return gaps
+
+
+def section_gaps(sections, text, filename="", new_section=Section):
     """
-    Finds the unlabeled sections in a text and labels them "Unlabeled". """
+    Finds the unlabeled sections in a text and labels them "Unlabeled". The sections are
+    created with new_section, which is usually the new_section() method of a factory. """
     
     gaps = []
     end = len(text)
@@ -198,43 +365,84 @@ def section_gaps(sections, text, filename=""):
         start_index = section.start_index
         end_index=section.end_index
         if start_index > covered:
-            ul_section = Section()
+            ul_section = new_section()
             ul_section.types = ["Unlabeled"]
             ul_section.filename = filename
             ul_section.start_index = covered
             ul_section.end_index = start_index
-            ul_section.text = text[covered:start_index]
+            ul_section.set_document(text)
             gaps.append(ul_section)
         if end_index > covered:
             covered = end_index
     if end > covered:
-        ul_section=Section()
+        ul_section = new_section()
         ul_section.types = ["Unlabeled"]
         ul_section.filename = filename
         ul_section.start_index = covered
         ul_section.end_index = end
-        ul_section.text = text[covered:end]
+        ul_section.set_document(text)
         gaps.append(ul_section)
     return gaps
 
 
 
-def link_sections(sections):
+def link_sections(sections, index=None):
     """ Links sections where one is subsuming the other. This does not quite build a tree,
     rather, for each section it creates a list of subsuming and subsumed sections. The
-    subsumers list is ordered though so that the parent is always the last element."""
-    for section in sections:
+    subsumers list is ordered though so that the parent is always the last element.
+
+    This is a sweep over the sections sorted on start offset, with longer sections first
+    for equal start offsets. While sweeping, the sections that may still subsume
+    something are kept in a list ordered on decreasing end offset, so the subsumers of a
+    section are a prefix of that list. Sections with an end before their start cannot be
+    handled that way and are compared to all other sections. The result is the same as
+    comparing all pairs with is_subsection(), including the order of the lists.
+
+    If a SectionIndex over the same sections is handed in, its order is used and the
+    sections are not sorted again."""
+    position = dict((id(section), p) for p, section in enumerate(sections))
+    subsumers = dict((id(section), []) for section in sections)
+    ordered = sections if index is None else index.sections
+    regular = [s for s in ordered if s.end_index >= s.start_index]
+    irregular = [s for s in sections if s.end_index < s.start_index]
+    if index is None:
+        regular.sort(key=lambda s: (s.start_index, -s.end_index))
+    active = []
+    keys = []
+    for section in regular:
+        # drop sections that end before this one starts, they cannot subsume it or any
+        # of the sections after it
+        while active and active[-1].end_index < section.start_index:
+            active.pop()
+            keys.pop()
+        found = subsumers[id(section)]
+        for other_section in active:
+            if other_section.end_index < section.end_index:
+                break
+            if len(other_section) > len(section):
+                found.append(other_section)
+        insert_at = bisect.bisect_right(keys, -section.end_index)
+        keys.insert(insert_at, -section.end_index)
+        active.insert(insert_at, section)
+    for section in irregular:
         for other_section in sections:
             if is_subsection(section, other_section):
-                section.subsumers.append(other_section)
-                for sem_type in other_section.types:
-                    section.subsumer_types.add(sem_type)
-                other_section.subsumed.append(section)
+                subsumers[id(section)].append(other_section)
+        for other_section in regular:
+            if is_subsection(other_section, section):
+                subsumers[id(other_section)].append(section)
+    # add the subsumers in the order of the sections list, which is the order in which a
+    # comparison of all pairs would add them
+    for section in sections:
+        found = subsumers[id(section)]
+        found.sort(key=lambda s: position[id(s)])
+        for other_section in found:
+            section.add_subsumer(other_section)
     # make sure that the subsumers are ordered so that the parent is always the last in
     # the list, this is also where the parent_id gets set
     for section in sections:
-        section.subsumers.sort(key= lambda x: x.start_index)
         if section.subsumers:
+            section.subsumers.sort(key= lambda x: x.start_index)
             section.parent_id = section.subsumers[-1].id
             
 def is_subsection(section, other_section):
@@ -244,18 +452,20 @@ def is_subsection(section, other_section):
         len(other_section) > len(section)):
             return True
 
-def make_section(text_file, tag, text, section_type=None):
+def make_section(text_file, tag, text, section_type=None, new_section=None):
     """Utility method to create a Section given a filename, a unicode string that contains
     the content of the document, an instance of readers.common.Tag and an optional section
-    type."""
+    type. If new_section is given, usually the new_section() method of a factory, it is
+    called with the section class to create the section."""
     if tag is None:
         return None
-    section = ClaimSection() if section_type == 'Claim' else Section()
+    section_class = ClaimSection if section_type == 'Claim' else Section
+    section = section_class() if new_section is None else new_section(section_class)
     if section_type is not None:
         section.types = [section_type]
     section.filename = text_file
     section.start_index = tag.start_index
     section.end_index = tag.end_index
-    section.text = tag.text(text)
+    section.set_document(text)
     section.tag = tag
     return section
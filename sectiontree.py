@@ -0,0 +1,368 @@
+"""
+
+The SectionTree used by the section factories for LexisNexis patents and CNKI documents.
+It is created from a dictionary of tags as returned by read_tags() in readers/lexisnexis.py
+and readers/cnki.py.
+
+There can be many thousands of nodes in a tree and some trees are deep, so nodes use
+slots and all traversals are iterative.
+
+"""
+
+import sys, re, bisect
+from operator import attrgetter
+
+import normheader
+
+
+# Used to detect paragraphs that are headers. Will probably overgeneralize if we are not
+# careful. For example, any paragraph that has 'background art' in it will now be a
+# heading. Limit header paragraphs to a maximum size.
+HEADER_PARAGRAPHS = (
+    'summary',
+    'summary of invention',
+    'summary of the invention',
+    'background',
+    'background of invention',
+    'background of the invention',
+    'background art',
+    'description of prior art',
+    'description of related art',
+    'field',
+    'field of invention',
+    'field of the invention')
+
+# Phrases for paragraphs that are headers in documents of a particular language, these
+# are used in addition to HEADER_PARAGRAPHS for documents in that language. Keys are
+# languages as used by the parser, for example 'GERMAN' or 'CHINESE', and values are
+# sequences of lower case phrases. Phrases should be added before the first tree for a
+# language is created, the detector for a language is made only once.
+HEADER_PARAGRAPHS_BY_LANGUAGE = {}
+
+# Header paragraphs are shorter than this, counting the normalized text.
+MAXIMUM_HEADER_LENGTH = 50
+
+# Mapping from structural tags to basic section types. Possibly belongs in normheader.
+TAGNAME_TO_TYPE_MAPPINGS = {
+    'date': ['Meta-Date'],
+    'invention-title': ['Meta-Title'],
+    'abstract': ['Abstract'],
+    'description': ['Description'],
+    'related-apps': ['Related_Applications'],
+    'summary': ['Summary'],
+    'heading': ['Header'],
+    'claims': ['Claims'],
+    'claim': ['Claim'] }
+
+
+def sorted_tags_from_dictionary(tag_dict):
+    """Return a sorted list of all tags in a dictionary, where the keys in the dictionary
+    are lists of Tags. Sorting is accoring to the begin and end offsets of the tags."""
+    all_tags = []
+    for tag_group in tag_dict.keys():
+        for tag in tag_dict[tag_group]:
+            all_tags.append(tag)
+    all_tags.sort()  # necessary for the insertion procedure
+    return all_tags
+
+def print_tag_list(tags, fname):
+    fh = open(fname, 'w')
+    for t in tags:
+        fh.write("%s\n" % t)
+
+
+class SectionTree(object):
+
+    """In a SectionTree, each child's offsets are (i) embedded in the offset of the
+    parent, (ii) precede the offsets of its reight sibling and (iii) follow the offsets of
+    its left sibling."""
+
+    def __init__(self, tags, text='', language=None):
+        """Initialize the tree given the unicode string for th enetire document and the
+        dictionary of tags. The language determines what paragraphs are headers."""
+        self.root = TopNode(self)
+        self.text = text
+        self.header_detector = header_detector(language)
+        self.idx = {}
+        # sorting is necessary for the insertion procedure
+        sorted_tags = sorted_tags_from_dictionary(tags)
+        #print_tag_list(sorted_tags, 'ws-tags.txt')
+        for tag in sorted_tags:
+            self.insert(tag)
+        self.sort()
+
+    def nodes(self):
+        return self.root.nodes()
+
+    def claims(self):
+        return [n for n in self.nodes() if n.name == 'claim']
+
+    def insert(self, tag):
+        new_node = Node(tag, self)
+        self.root.insert(new_node)
+
+    def sort(self):
+        self.root.sort()
+
+    def header_types(self, node, cache):
+        """Return the semantic types for the text of a header node, using a dictionary
+        of texts that were typed before."""
+        text = node.text()
+        if text not in cache:
+            cache[text] = normheader.header_to_types(text)
+            #cache[text] = [t for t in cache[text] if t != 'Other']
+        return cache[text]
+
+    def annotate(self):
+        """Finds the paragraphs that are headers and adds types to all nodes, in one pass
+        over the nodes in document order. For each node, it first checks whether a
+        paragraph is a header, in which case its name is changed into heading, then adds
+        the types of its tag to those of its parent, and then adds the types of the last
+        header. The types of a header are added to all nodes that follow it, up to the
+        next header or the next claims node, but they are not handed down to children,
+        so the children start from the types of the parent as they were before any
+        header types were added."""
+        # TODO: this copies the behaviour of the old code, but it does not deal with
+        # embedded headers. If for example you have two consecutive paragraphs where the
+        # first is 'BACKGROUND OF THE INVENTION' and the very next is '1. Field of the
+        # Invention', then any types derived from the first will be blocked by the second.
+        cache = {}
+        detector = self.header_detector
+        header_types = None
+        self.root.types = [] + TAGNAME_TO_TYPE_MAPPINGS.get(self.root.name, [])
+        stack = [(n, self.root.types) for n in reversed(self.root.children)]
+        while stack:
+            (node, parent_types) = stack.pop()
+            if node.name == 'p' and detector.is_header(self.text, node.p1, node.p2):
+                node.name = 'heading'
+            types = parent_types + TAGNAME_TO_TYPE_MAPPINGS.get(node.name, [])
+            node.types = types
+            if node.is_header():
+                header_types = self.header_types(node, cache)
+            elif node.name == 'claims':
+                header_types = None
+            if header_types:
+                node.types = types[:]
+                node.add_header_types(header_types)
+            if node.children:
+                stack.extend([(n, types) for n in reversed(node.children)])
+
+    def pp(self):
+        self.root.pp()
+
+    def pp_nodes(self):
+        for n in self.nodes():
+            print n.tag
+
+    def pp_index(self):
+        for tagname, nodes in self.idx.items():
+            print tagname
+            for node in nodes:
+                print '  ', node
+
+
+class Node(object):
+
+    INDENT_STEP = '   '
+
+    __slots__ = ('p1', 'p2', 'name', 'types', 'tag', 'children', 'child_ends', 'tree')
+
+    def __init__(self, tag, tree=None):
+        self.p1 = tag.start_index
+        self.p2 = tag.end_index
+        #self.name = tag.get_type() if tag.fact_type == 'BAE' else tag.name
+        self.name = tag.name
+        self.types = []
+        self.tag = tag
+        self.children = []
+        self.child_ends = []
+        self.tree = tree
+
+    def __str__(self):
+        text = self.tree.text[self.p1:self.p2].replace("\n", ' ').strip()
+        if self.name == 'heading':
+            text = ' ===== ' + text + ' ====='
+        elif self.name in ('p', 'claim'):
+            text = ' "' + text[:70] + '..."'
+        else:
+            text = ''
+        return "%d-%d %s %s%s" % (self.p1, self.p2, self.name, self.types, text)
+
+    def __cmp__(self, other):
+        return cmp(self.p1, other.p1)
+
+    def text(self):
+        return self.tree.text[self.p1:self.p2]
+
+    def walk(self):
+        """Generate pairs of a node and its depth for all nodes below self, in document
+        order, where the children of self are at depth 1."""
+        stack = [(n, 1) for n in reversed(self.children)]
+        while stack:
+            (node, depth) = stack.pop()
+            yield (node, depth)
+            if node.children:
+                stack.extend([(n, depth + 1) for n in reversed(node.children)])
+
+    def nodes(self):
+        """Return a list of all nodes below self, in document order."""
+        collected_nodes = []
+        stack = self.children[::-1]
+        while stack:
+            node = stack.pop()
+            collected_nodes.append(node)
+            if node.children:
+                stack.extend(reversed(node.children))
+        return collected_nodes
+
+    def is_header(self):
+        return self.name == 'heading'
+
+    def contains(self, node):
+        """Return True if self contains the other node."""
+        return self.p1 <= node.p1 and self.p2 >= node.p2
+
+    def get_children_contained_by_node(self, other_node):
+        """Return a ist of indexes in self.children with all children that are contained
+        in other_node."""
+        idx = -1
+        contained_nodes = []
+        for node in self.children:
+            idx += 1
+            if other_node.contains(node):
+                contained_nodes.append(idx)
+        return contained_nodes
+
+    def insert(self, new_node):
+        """Insert a new node into self, this assumes that self contains the new node (that
+        is, it starts before and ends after the new node. The node is handed down to the
+        first child that contains it, until there is no such child. Nodes are inserted in
+        the order of their begin offsets, so each child starts before the new node, and
+        the first child that contains the new node is the first one that ends after it.
+        That child is found with a binary search on child_ends, which has for each child
+        the largest end offset of that child and the children before it."""
+        node = self
+        while True:
+            idx = bisect.bisect_left(node.child_ends, new_node.p2)
+            if idx == len(node.children):
+                break
+            node = node.children[idx]
+        # there used to be a flip here if some children were contained by the new node,
+        # it was disabled because it is not needed, flip() is left in case it comes in
+        # handy, but note that it does not update child_ends
+        node.append_child(new_node)
+
+    def append_child(self, new_node):
+        end = new_node.p2
+        if self.child_ends and self.child_ends[-1] > end:
+            end = self.child_ends[-1]
+        self.children.append(new_node)
+        self.child_ends.append(end)
+
+    def flip(self, new_node, contained_nodes):
+        i1 = contained_nodes[0]
+        i2 = contained_nodes[-1]
+        new_node.children = self.children[i1:i2+1]
+        self.children[i1:i2+1] = [new_node]
+
+    def sort(self):
+        """Sort the children of self and of all nodes below it on their begin offsets. The
+        sort is stable so this does not change the order of nodes that are inserted in
+        order, and child_ends stays valid."""
+        start = attrgetter('p1')
+        self.children.sort(key=start)
+        for node in self.nodes():
+            if node.children:
+                node.children.sort(key=start)
+
+    def add_header_types(self, header_types):
+        """Add types inherited from a sibling header, but only if it does not add
+        redundant type information."""
+        closest_type = self.types[-1] if self.types else None
+        for ht in header_types:
+            if closest_type != ht:
+                self.types.append(ht)
+
+    def pp(self, indent=0):
+        self.pp_default(indent)
+
+    def pp_default(self, indent=0):
+        print "%s%s" % (indent * Node.INDENT_STEP, self)
+        for (node, depth) in self.walk():
+            print "%s%s" % ((indent + depth) * Node.INDENT_STEP, node)
+
+    def pp_with_attributes(self, indent=0):
+        attrs = ''
+        if self.tag is not None:
+            attrs = " {%s}" % ', '.join(["%s=%s" % (a,v)
+                                         for (a,v) in self.tag.attributes.items()
+                                         if a not in ('standoff:length', 'standoff:offset')])
+        print "%s<%s %d %d> %s" % (indent * Node.INDENT_STEP, self.name, self.p1, self.p2, attrs)
+
+
+class TopNode(Node):
+
+    __slots__ = ()
+
+    def __init__(self, tree=None):
+        self.p1 = 0
+        self.p2 = sys.maxint
+        self.name = 'root'
+        self.types = []
+        self.tag = None
+        self.children = []
+        self.child_ends = []
+        self.tree = tree
+
+
+def text_is_header(text, language=None):
+    """Return True if text is likely to be a header, which is the case if it is below a
+    certain size and contains a string indicative of headers. Should probably use a
+    similar approach as for the simple Elsevier documents."""
+    return header_detector(language).is_header(text)
+
+def header_detector(language=None):
+    """Return the HeaderDetector for a language, these are created when first needed."""
+    if language not in _header_detectors:
+        phrases = HEADER_PARAGRAPHS + tuple(HEADER_PARAGRAPHS_BY_LANGUAGE.get(language, ()))
+        _header_detectors[language] = HeaderDetector(phrases)
+    return _header_detectors[language]
+
+_header_detectors = {}
+
+
+class HeaderDetector(object):
+
+    """Decides whether a paragraph is a header. The text of the paragraph is lower cased
+    and its whitespace is normalized, and it is a header if that text is shorter than
+    MAXIMUM_HEADER_LENGTH and contains one of the header phrases. All phrases are in one
+    regular expression. The paragraph is given as offsets in the text of the document,
+    and for long paragraphs only the beginning is looked at. If the normalized beginning
+    is already too long then so is the normalized paragraph, so the work done for a long
+    paragraph does not depend on its length."""
+
+    def __init__(self, phrases, maximum_length=MAXIMUM_HEADER_LENGTH):
+        self.maximum_length = maximum_length
+        self.window = 4 * maximum_length
+        phrases = sorted(set(phrases), key=lambda p: (-len(p), p))
+        self.pattern = None
+        if phrases:
+            self.pattern = re.compile('|'.join([re.escape(p) for p in phrases]))
+
+    def is_header(self, text, start=0, end=None):
+        """Return True if the text from start to end is a header, start and end are
+        interpreted as in text[start:end]."""
+        if self.pattern is None:
+            return False
+        (start, end, step) = slice(start, end).indices(len(text))
+        window_end = min(end, start + self.window)
+        words = text[start:window_end].split()
+        if window_end < end:
+            if len(words) + sum([len(w) for w in words]) > self.maximum_length:
+                return False
+            # a long paragraph that is mostly whitespace
+            words = text[start:end].split()
+        normalized = ' '.join(words)
+        if len(normalized) >= self.maximum_length:
+            return False
+        return self.pattern.search(normalized.lower()) is not None
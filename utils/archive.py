@@ -0,0 +1,137 @@
+"""
+
+Reading documents straight out of corpus archives and writing sect files to a directory
+or to another archive, so that a corpus does not have to be unpacked first.
+
+Input archives are tar files, compressed or not, zip files and gzipped xml files. In a
+tar or zip archive, a document is either a pair of members with the same name and the
+extensions .txt and .fact, or a member with the extension .xml. Tar files are read as a
+stream, a .txt or .fact member is kept in memory until its sister member turns up, which
+is usually right away since archives are mostly created from sorted file lists. Members
+without a sister are skipped, as they are when processing a directory.
+
+"""
+
+
+import os, time, tarfile, zipfile, gzip, StringIO
+
+
+ARCHIVE_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.zip', '.gz')
+
+# the extensions of the archives that can be written, anything else is a directory
+OUTPUT_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.zip')
+
+TAR_WRITE_MODES = {'.tar': 'w', '.gz': 'w:gz', '.tgz': 'w:gz', '.bz2': 'w:bz2'}
+
+
+def is_archive(path):
+    return os.path.isfile(path) and path.endswith(ARCHIVE_EXTENSIONS)
+
+
+def documents(archive, skipped=None):
+    """Generates the documents in an archive as pairs of a name and a dictionary with the
+    contents of the members. The name is the name of the member(s) without the extension
+    and the dictionary has the keys 'txt' and 'fact' or the key 'xml'. When the archive
+    is done, the names of the .txt and .fact members without a sister are added to the
+    skipped list, if one is handed in."""
+    pending = {}
+    for (name, content) in members(archive):
+        (base, extension) = os.path.splitext(name)
+        if extension == '.xml':
+            yield (base, {'xml': content})
+        elif extension in ('.txt', '.fact'):
+            document = pending.setdefault(base, {})
+            document[extension[1:]] = content
+            if len(document) == 2:
+                del pending[base]
+                yield (base, document)
+    if skipped is not None:
+        for base, document in sorted(pending.items()):
+            skipped.extend([base + '.' + extension for extension in document])
+
+
+def members(archive):
+    """Generates pairs of the name and the contents of the regular files in an archive.
+    A gzipped file that is not a tar file has one member, named after the archive."""
+    if archive.endswith('.zip'):
+        zip_file = zipfile.ZipFile(archive)
+        try:
+            for info in zip_file.infolist():
+                if not info.filename.endswith('/'):
+                    yield (info.filename, zip_file.read(info))
+        finally:
+            zip_file.close()
+    elif archive.endswith('.gz') and not tarfile.is_tarfile(archive):
+        fh = gzip.open(archive, 'rb')
+        try:
+            yield (os.path.basename(archive)[:-3], fh.read())
+        finally:
+            fh.close()
+    else:
+        tar_file = tarfile.open(archive, 'r|*')
+        try:
+            for info in tar_file:
+                if info.isfile():
+                    yield (info.name, tar_file.extractfile(info).read())
+        finally:
+            tar_file.close()
+
+
+def safe_name(name):
+    """Returns the name of a member as a relative path without empty, . and .. parts, so
+    that nothing is written outside of the output directory or archive."""
+    parts = name.replace('\\', '/').split('/')
+    return '/'.join([part for part in parts if part not in ('', '.', '..')])
+
+
+class MemoryFile(StringIO.StringIO):
+
+    """A file in memory that keeps its contents when it is closed, so it can be handed to
+    code that closes the file when it is done writing, like print_sections()."""
+
+    def close(self):
+        pass
+
+
+class SectWriter(object):
+
+    """
+    Writes sect files to a directory, or to a tar or zip archive if the output path has
+    one of the OUTPUT_EXTENSIONS. Sect files are written with the relative name of the
+    document in the input archive. """
+
+    def __init__(self, path):
+        self.path = path
+        self.written = 0
+        self.archive = None
+        if path.endswith('.zip'):
+            self.archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        elif path.endswith(OUTPUT_EXTENSIONS):
+            mode = TAR_WRITE_MODES[os.path.splitext(path)[1]]
+            self.archive = tarfile.open(path, mode)
+        elif not os.path.isdir(path):
+            os.makedirs(path)
+
+    def write(self, name, content):
+        """Write content, a string of bytes, as the sect file for name."""
+        name = safe_name(name)
+        if isinstance(self.archive, zipfile.ZipFile):
+            self.archive.writestr(name, content)
+        elif self.archive is not None:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            info.mtime = time.time()
+            self.archive.addfile(info, StringIO.StringIO(content))
+        else:
+            filename = os.path.join(self.path, name)
+            directory = os.path.dirname(filename)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            fh = open(filename, 'wb')
+            fh.write(content)
+            fh.close()
+        self.written += 1
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
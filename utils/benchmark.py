@@ -0,0 +1,682 @@
+"""
+
+Micro-benchmarks for the document structure parser.
+
+Usage:
+
+   % python -m utils.benchmark BENCHMARK [REPEAT]
+
+   BENCHMARK is one of the names in BENCHMARKS below and REPEAT is the number of times
+   each timed function is run, the best time is reported.
+
+Benchmarks:
+
+   facts     -  splitting fact lines with shlex.split() versus split_fact_line(), on all
+               fact files in data/in and on the fact lines created from the xml files in
+               data/in/lexisnexis
+
+   links     -  linking sections with a comparison of all pairs versus the sweep in
+               sections.link_sections(), on synthetic patents with growing numbers of
+               sections, the pairwise version is only run on the smaller documents
+
+   tree      -  building the lexisnexis.SectionTree with the original insertion, which
+               goes through the children of a node one by one, versus the binary search
+               on child end offsets, on synthetic patents with thousands of claims
+
+   traversal -  the traversals of a SectionTree, using the original recursive versions
+               and the iterative versions in sectiontree.py, on a synthetic patent
+
+   annotate  -  finding headers and adding types to a SectionTree with the original three
+               passes, where copying header types scans forward from each header, versus
+               SectionTree.annotate(), on synthetic patents
+
+   headers   -  typing headers with the original loop over normheader.sem_types versus
+               the compiled matcher, with and without the cache, on all short lines in
+               the text files in data/in
+
+   paragraphs - finding header paragraphs with the original text_is_header(), which
+               normalizes the whole paragraph and then looks for each header phrase,
+               versus the HeaderDetector in sectiontree.py, on synthetic patents with
+               paragraphs of growing length
+
+   elsevier1 -  splitting the text of an unstructured Elsevier segment into lines with
+               the original loop over characters versus str.split(), and the time of
+               creating the sections of the segment, on synthetic segments of growing
+               size made from data/in/elsevier/elsevier-simple.txt
+
+   elsevier2 -  matching titles and text structures in readers.elsevier2.headed_sections()
+               with the original loop over all text structures for each title versus the
+               binary search for the text structures near each title, on the tags of
+               data/in/elsevier/elsevier-complex and on copies of those tags
+
+   abstracts -  deduplicating abstracts and finding gaps in the elsevier2 factory with the
+               original loop over all abstract sections for each abstract tag and the
+               sorting in section_gaps(), versus one sections.SectionIndex, on synthetic
+               documents with growing numbers of sections
+
+   pubmed    -  matching headers with sections and titles with text structures in
+               readers.pubmed.headed_sections() with the original nested loops versus
+               the table on start offsets and the binary search on text structures, on
+               copies of the tags of data/in/pubmed/pubmed-mm-test with a title and a
+               sec tag added for each title structure
+
+Run this from the directory that contains main.py.
+
+"""
+
+
+import os, sys, re, glob, time, shlex, codecs, itertools
+
+import normheader
+
+from readers.common import Tag, split_fact_line, make_tags
+from readers.common import structures_with_type, structures_with_matching_type
+from readers.common import tags_with_name, tags_with_type
+from readers.elsevier2 import headed_sections
+from readers.pubmed import headed_sections as pubmed_headed_sections
+from sectiontree import SectionTree, Node, TAGNAME_TO_TYPE_MAPPINGS, HEADER_PARAGRAPHS
+from sections import Section, SectionIndex, link_sections, is_subsection, section_gaps
+from elsevier2 import section_gaps as elsevier2_section_gaps
+from elsevier1 import ElsevierSegment
+from utils.xml import standoff
+
+
+def best_time(function, repeat=5):
+    """Return the best time in seconds of running function repeat times."""
+    times = []
+    for i in range(repeat):
+        t1 = time.time()
+        function()
+        times.append(time.time() - t1)
+    return min(times)
+
+def report(name, t1, t2):
+    print "   %-35s %8.4fs  %8.4fs  %6.1fx" % (name, t1, t2, t1 / t2 if t2 else 0)
+
+
+def fact_lines():
+    """Return all fact lines from data/in as utf-8 encoded strings, including those
+    created from the patent xml files."""
+    lines = []
+    for fact_file in glob.glob('data/in/*/*.fact'):
+        lines.extend([l for l in open(fact_file) if l.strip()])
+    for xml_file in glob.glob('data/in/lexisnexis/*.xml'):
+        lines.extend([l.encode('utf-8') for l in standoff(xml_file)[1]])
+    return lines
+
+def benchmark_facts(repeat):
+    lines = fact_lines() * 10
+    print "\nSplitting %d fact lines\n" % len(lines)
+    print "   %-35s %9s  %9s  %7s" % ('', 'shlex', 'new', 'speedup')
+    t1 = best_time(lambda: [shlex.split(l) for l in lines], repeat)
+    t2 = best_time(lambda: [split_fact_line(l) for l in lines], repeat)
+    report('split lines', t1, t2)
+    print
+
+
+def synthetic_sections(count):
+    """Return a list of about count sections that look like those of a patent: a
+    description with headed blocks of paragraphs and a claims section with claims, in
+    the order in which the patent factory creates them."""
+    ids = itertools.count(1)
+    def section(p1, p2, section_type):
+        s = Section(ids.next())
+        (s.start_index, s.end_index, s.types) = (p1, p2, [section_type])
+        return s
+    paragraphs = count * 2 / 3
+    claims = count - paragraphs
+    sections = [section(0, paragraphs * 100, 'Description')]
+    for p in range(0, paragraphs, 20):
+        sections.append(section(p * 100, min(p + 20, paragraphs) * 100, 'Block'))
+    for p in range(paragraphs):
+        sections.append(section(p * 100 + 10, p * 100 + 90, 'Paragraph'))
+    offset = paragraphs * 100
+    sections.append(section(offset, offset + claims * 100, 'Claims'))
+    for c in range(claims):
+        sections.append(section(offset + c * 100, offset + c * 100 + 95, 'claim'))
+    return sections
+
+def link_sections_pairwise(sections):
+    """The original version of sections.link_sections(), comparing all pairs."""
+    for section in sections:
+        for other_section in sections:
+            if is_subsection(section, other_section):
+                section.add_subsumer(other_section)
+    for section in sections:
+        if section.subsumers:
+            section.subsumers.sort(key= lambda x: x.start_index)
+            section.parent_id = section.subsumers[-1].id
+
+def linked(sections):
+    """Return the links as positions in the list of sections, which unlike the section
+    identifiers are the same for two lists created by synthetic_sections()."""
+    position = dict((s.id, p) for p, s in enumerate(sections))
+    return [(position.get(s.parent_id),
+             [position[x.id] for x in s.subsumers],
+             [position[x.id] for x in s.subsumed]) for s in sections]
+
+def benchmark_links(repeat, pairwise_limit=4000):
+    print "\nLinking sections\n"
+    print "   %-35s %9s  %9s  %7s" % ('', 'pairwise', 'sweep', 'speedup')
+    for count in (500, 1000, 2000, 4000, 8000, 16000, 32000, 64000):
+        # use fresh sections for each run since linking adds to the sections
+        t1 = 0
+        if count <= pairwise_limit:
+            t1 = best_time(lambda: link_sections_pairwise(synthetic_sections(count)), repeat)
+            (sections1, sections2) = (synthetic_sections(count), synthetic_sections(count))
+            link_sections_pairwise(sections1)
+            link_sections(sections2)
+            if linked(sections1) != linked(sections2):
+                print "   WARNING: different links for %d sections" % count
+        t2 = best_time(lambda: link_sections(synthetic_sections(count)), repeat)
+        t0 = best_time(lambda: synthetic_sections(count), repeat)
+        name = "%d sections" % count
+        if t1:
+            report(name, t1 - t0, t2 - t0)
+        else:
+            print "   %-35s %9s  %8.4fs" % (name, '-', t2 - t0)
+    print
+
+
+def synthetic_patent_tags(claims):
+    """Return a dictionary of tags like the one created by readers.lexisnexis.read_tags()
+    for a patent with the given number of claims and twice as many paragraphs."""
+    def tag(name, p1, p2):
+        line = '%s standoff:offset="%d" standoff:length="%d"' % (name, p1, p2 - p1)
+        return Tag(line, 'BASIC')
+    paragraphs = claims * 2
+    offset = paragraphs * 100
+    return {
+        'description': [tag('description', 0, offset)],
+        'p': [tag('p', p * 100, p * 100 + 90) for p in range(paragraphs)],
+        'claims': [tag('claims', offset, offset + claims * 100)],
+        'claim': [tag('claim', offset + c * 100, offset + c * 100 + 95)
+                  for c in range(claims)] }
+
+class LinearSectionTree(SectionTree):
+    """SectionTree with the original insertion, which hands a new node to the first
+    child that contains it by looking at all children in turn."""
+    def insert(self, tag):
+        linear_insert(self.root, Node(tag, self))
+
+def linear_insert(node, new_node):
+    for child in node.children:
+        if child.contains(new_node):
+            linear_insert(child, new_node)
+            return
+    node.get_children_contained_by_node(new_node)
+    node.children.append(new_node)
+
+def tree_shape(node):
+    return [(child.p1, child.p2, child.name, tree_shape(child)) for child in node.children]
+
+def benchmark_tree(repeat, linear_limit=2000):
+    print "\nBuilding section trees\n"
+    print "   %-35s %9s  %9s  %7s" % ('', 'linear', 'bisect', 'speedup')
+    for claims in (250, 500, 1000, 2000, 4000, 8000, 16000):
+        tags = synthetic_patent_tags(claims)
+        t1 = 0
+        if claims <= linear_limit:
+            if tree_shape(LinearSectionTree(tags).root) != tree_shape(SectionTree(tags).root):
+                print "   WARNING: different trees for %d claims" % claims
+            t1 = best_time(lambda: LinearSectionTree(tags), repeat)
+        t2 = best_time(lambda: SectionTree(tags), repeat)
+        name = "%d claims" % claims
+        if t1:
+            report(name, t1, t2)
+        else:
+            print "   %-35s %9s  %8.4fs" % (name, '-', t2)
+    print
+
+def synthetic_patent_text(claims):
+    """Return a text for synthetic_patent_tags(claims) where some of the paragraphs are
+    headers."""
+    paragraph = (u'The device comprises a frame and a lever. ' * 3)[:89] + u'\n'
+    header = u'BACKGROUND OF THE INVENTION'.ljust(89) + u'\n'
+    paragraphs = [header if p % 20 == 0 else paragraph for p in range(claims * 2)]
+    return u''.join(paragraphs) + u''.join([(u'%d. ' % c) + paragraph[4:]
+                                            for c in range(claims)])
+
+def recursive_nodes(node, collected_nodes):
+    for n in node.children:
+        collected_nodes.append(n)
+        recursive_nodes(n, collected_nodes)
+    return collected_nodes
+
+def recursive_sort(node):
+    node.children.sort()
+    for n in node.children:
+        recursive_sort(n)
+
+def loop_text_is_header(text):
+    """The original version of sectiontree.text_is_header()."""
+    text = ' '.join(text.strip().lower().split())
+    for header in HEADER_PARAGRAPHS:
+        if len(text) < 50 and text.find(header) > -1:
+            return True
+    return False
+
+def recursive_find_headers(node):
+    for n in node.children:
+        if n.name == 'p':
+            if loop_text_is_header(n.text()):
+                n.name = 'heading'
+        recursive_find_headers(n)
+
+def recursive_add_types(node, type_list):
+    type_list = type_list + TAGNAME_TO_TYPE_MAPPINGS.get(node.name, [])
+    node.types = type_list
+    for n in node.children:
+        recursive_add_types(n, type_list)
+
+def nested_tags(depth):
+    """Return a dictionary with depth paragraph tags that are nested in each other."""
+    line = 'p standoff:offset="%d" standoff:length="%d"'
+    return {'p': [Tag(line % (d, 2 * (depth - d)), 'BASIC') for d in range(depth)]}
+
+def benchmark_traversal(repeat, claims=4000, depth=5000):
+    """Time the traversals on a synthetic patent and on a tree with nested paragraphs
+    that is deeper than the recursion limit, on which the recursive versions fail."""
+    trees = (
+        ('patent', SectionTree(synthetic_patent_tags(claims), synthetic_patent_text(claims))),
+        ('nested', SectionTree(nested_tags(depth), u'x' * depth * 2)))
+    for (tree_name, tree) in trees:
+        root = tree.root
+        print "\nTraversing a %s tree with %d nodes\n" % (tree_name, len(tree.nodes()))
+        print "   %-35s %9s  %9s  %7s" % ('', 'recursive', 'iterative', 'speedup')
+        for (name, recursive, iterative) in (
+                ('nodes', lambda: recursive_nodes(root, []), root.nodes),
+                ('sort', lambda: recursive_sort(root), root.sort)):
+            t2 = best_time(iterative, repeat)
+            try:
+                t1 = best_time(recursive, repeat)
+                report(name, t1, t2)
+            except RuntimeError:
+                print "   %-35s %9s  %8.4fs" % (name, 'failed', t2)
+    print
+
+def three_pass_annotate(tree):
+    """The original way of annotating a tree, with a copy of header types that goes
+    forward from each header to the next one."""
+    recursive_find_headers(tree.root)
+    recursive_add_types(tree.root, [])
+    nodes = recursive_nodes(tree.root, [])
+    for i in range(len(nodes)):
+        node = nodes[i]
+        if node.is_header():
+            header_types = normheader.header_to_types(node.text())
+            if not header_types:
+                continue
+            node.add_header_types(header_types)
+            for j in range(i + 1, len(nodes)):
+                next = nodes[j]
+                if next.is_header(): break
+                if next.name == 'claims': break
+                next.add_header_types(header_types)
+
+def time_on_new_trees(function, tags, text, repeat):
+    """Return the best time of running function on a newly built tree."""
+    times = []
+    for i in range(repeat):
+        tree = SectionTree(tags, text)
+        t1 = time.time()
+        function(tree)
+        times.append(time.time() - t1)
+    return min(times)
+
+def benchmark_annotate(repeat):
+    print "\nAnnotating section trees\n"
+    print "   %-35s %9s  %9s  %7s" % ('', '3 passes', 'annotate', 'speedup')
+    for claims in (500, 1000, 2000, 4000, 8000):
+        (tags, text) = (synthetic_patent_tags(claims), synthetic_patent_text(claims))
+        (tree1, tree2) = (SectionTree(tags, text), SectionTree(tags, text))
+        three_pass_annotate(tree1)
+        tree2.annotate()
+        if [n.types for n in tree1.nodes()] != [n.types for n in tree2.nodes()]:
+            print "   WARNING: different types for %d claims" % claims
+        t1 = time_on_new_trees(three_pass_annotate, tags, text, repeat)
+        t2 = time_on_new_trees(SectionTree.annotate, tags, text, repeat)
+        report("%d claims" % claims, t1, t2)
+    print
+
+
+def header_lines():
+    """Return all lines shorter than 60 characters from the text files in data/in."""
+    lines = []
+    for text_file in glob.glob('data/in/*/*.txt'):
+        lines.extend([l for l in codecs.open(text_file, encoding='utf-8')
+                      if l.strip() and len(l) < 60])
+    return lines
+
+def loop_header_to_types(section_head):
+    """The original version of normheader.header_to_types()."""
+    section_head = section_head.lower()
+    section_head = re.sub(r'\W|\d', '', section_head, re.UNICODE)
+    head_types = []
+    for sem_type in normheader.sem_types:
+        for ch_string in normheader.sem_types[sem_type][0]:
+            if ch_string in section_head:
+                excluded = False
+                for ex_string in normheader.sem_types[sem_type][1]:
+                    if ex_string in section_head:
+                        excluded = True
+                if not excluded:
+                    head_types.append(sem_type)
+                    break
+    if len(head_types) < 1:
+        head_types.append("Other")
+    return head_types
+
+def benchmark_headers(repeat):
+    headers = header_lines() * 10
+    matcher = normheader.HeaderMatcher(normheader.sem_types)
+    uncached = lambda h: matcher.types(normheader.norm_section_head(h))
+    print "\nTyping %d headers, %d different ones\n" % (len(headers), len(set(headers)))
+    print "   %-35s %9s  %9s  %7s" % ('', 'loop', 'new', 'speedup')
+    t1 = best_time(lambda: [loop_header_to_types(h) for h in headers], repeat)
+    t2 = best_time(lambda: [uncached(h) for h in headers], repeat)
+    t3 = best_time(lambda: [normheader.header_to_types(h) for h in headers], repeat)
+    report('compiled matcher', t1, t2)
+    report('compiled matcher and cache', t1, t3)
+    print
+
+
+def benchmark_paragraphs(repeat, claims=1000):
+    print "\nFinding header paragraphs in a patent with %d paragraphs\n" % (claims * 2)
+    print "   %-35s %9s  %9s  %7s" % ('', 'original', 'detector', 'speedup')
+    tags = synthetic_patent_tags(claims)
+    for size in (1, 10, 100):
+        # stretch all offsets so each paragraph is size times longer
+        text = u''.join([line * size for line in synthetic_patent_text(claims).splitlines()])
+        tree = SectionTree(tags, text)
+        for node in tree.nodes():
+            (node.p1, node.p2) = (node.p1 * size, node.p2 * size)
+        paragraphs = [n for n in tree.nodes() if n.name == 'p']
+        detector = tree.header_detector
+        original = lambda: [loop_text_is_header(n.text()) for n in paragraphs]
+        new = lambda: [detector.is_header(text, n.p1, n.p2) for n in paragraphs]
+        if original() != new():
+            print "   WARNING: different headers for paragraphs of %d characters" % (size * 90)
+        t1 = best_time(original, repeat)
+        t2 = best_time(new, repeat)
+        report("paragraphs of %d characters" % (size * 90), t1, t2)
+    print
+
+
+def character_loop_lines(text):
+    """The original way of splitting a segment into lines, returns a list of lines with
+    their begin and end offsets."""
+    lines = []
+    line, i, max = '', 0, len(text)
+    begin, end = i, i
+    while i < max:
+        char = text[i]
+        if text[i] == "\n":
+            lines.append((line, begin, end))
+            line, begin, end = '', i, i
+        else:
+            line += char
+            end += 1
+        i += 1
+    return lines
+
+class SegmentText(object):
+    """Stands in for the factory that an ElsevierSegment takes its text from."""
+    def __init__(self, text):
+        self.text = text
+        self.text_file = 'benchmark.txt'
+        self.new_section = Section
+
+def benchmark_elsevier1(repeat):
+    simple = codecs.open('data/in/elsevier/elsevier-simple.txt', encoding='utf-8').read()
+    print "\nUnstructured Elsevier segments\n"
+    print "   %-35s %9s  %9s  %7s" % ('', 'loop', 'split', 'speedup')
+    for copies in (1, 10, 100):
+        text = SegmentText(simple * copies)
+        segment = ElsevierSegment(text, 0, len(text.text))
+        segment._read_lines()
+        lines = [(l.line, l.begin, l.end) for l in segment.lines]
+        if character_loop_lines(segment.text) != lines:
+            print "   WARNING: different lines for %d copies" % copies
+        t1 = best_time(lambda: character_loop_lines(segment.text), repeat)
+        t2 = best_time(segment._read_lines, repeat)
+        report("lines, %d characters" % len(text.text), t1, t2)
+    for copies in (1, 10, 100):
+        text = SegmentText(simple * copies)
+        t = best_time(lambda: ElsevierSegment(text, 0, len(text.text)).make_sections(), repeat)
+        print "   %-35s %9s  %8.4fs" % ("sections, %d characters" % len(text.text), '', t)
+    print
+
+
+def nested_loop_headed_sections(tags, doc_length, max_title_lead=50, max_title_follow=50):
+    """The original version of readers.elsevier2.headed_sections(), for the default of
+    separate_headers=True."""
+    title_structures = structures_with_type(tags, "TITLE")
+    text_structures = structures_with_matching_type(tags, "TEXT", 0, 4)
+    matches = []
+    header_matches = []
+    title_structures = sorted(title_structures, key=lambda x: x.start_index)
+    text_structures = sorted(text_structures, key=lambda x: x.start_index)
+    for index in range(len(title_structures)-1):
+        title = title_structures[index]
+        next_title = title_structures[index+1]
+        titled_paras = []
+        titled_chunks = []
+        for text_structure in text_structures:
+            if (text_structure.attributes["TYPE"] == "TEXT_CHUNK"
+                and title.start_index < text_structure.start_index + max_title_follow
+                and text_structure.start_index - title.end_index < max_title_lead):
+                titled_chunks.append(text_structure)
+            elif (title.start_index < text_structure.start_index + max_title_follow
+                  and text_structure.end_index < next_title.start_index
+                  and len(titled_chunks) == 0):
+                immediate_follower = False
+                if (text_structure.start_index - title.end_index < max_title_lead
+                    and len(titled_paras) < 1):
+                    immediate_follower = True
+                if immediate_follower:
+                    header_matches.append(title)
+                if immediate_follower or len(titled_paras) > 0:
+                    titled_paras.append(text_structure)
+        titled_chunks = filter(lambda x: len(x) < doc_length/4, titled_chunks)
+        if len(titled_chunks) > 0:
+            best_chunk = sorted(titled_chunks, key=len)[-1]
+            header_matches.append(title)
+            matches.append((title, [best_chunk]))
+        elif len(titled_paras) > 0:
+            matches.append((title, titled_paras))
+    matches.extend(header_matches)
+    return matches
+
+def copied_structures(fact_file, copies, doc_length, as_lines=False):
+    """Return a TagStore with the STRUCTURE tags of fact_file repeated copies times,
+    each copy shifted by doc_length, or the fact lines for those tags if as_lines=True."""
+    structures = [l for l in open(fact_file) if l.startswith('STRUCTURE')]
+    shift = lambda match, n: "%s=%d" % (match.group(1), int(match.group(2)) + n)
+    lines = []
+    for i in range(copies):
+        lines.extend([re.sub(r'(START|END)=(\d+)', lambda m: shift(m, i * doc_length), l)
+                      for l in structures])
+    return lines if as_lines else make_tags(lines)
+
+def matched_offsets(matches):
+    return [(m[0].start_index, [t.start_index for t in m[1]]) if type(m) == tuple
+            else m.start_index for m in matches]
+
+def benchmark_elsevier2(repeat):
+    basename = 'data/in/elsevier/elsevier-complex'
+    doc_length = len(codecs.open(basename + '.txt', encoding='utf-8').read())
+    print "\nMatching titles and text structures\n"
+    print "   %-35s %9s  %9s  %7s" % ('', 'loops', 'bisect', 'speedup')
+    for copies in (1, 10, 100):
+        tags = copied_structures(basename + '.fact', copies, doc_length)
+        length = doc_length * copies
+        if (matched_offsets(nested_loop_headed_sections(tags, length))
+            != matched_offsets(headed_sections(tags, length))):
+            print "   WARNING: different matches for %d copies" % copies
+        t1 = best_time(lambda: nested_loop_headed_sections(tags, length), repeat)
+        t2 = best_time(lambda: headed_sections(tags, length), repeat)
+        report("%d titles" % len(structures_with_type(tags, "TITLE")), t1, t2)
+    print
+
+
+def nested_loop_pubmed_headed_sections(tags, max_title_lead=30, separate_headers=True,
+                                       max_title_follow=30):
+    """The original version of readers.pubmed.headed_sections(), which compares all
+    headers with all sections and all titles with all text structures."""
+    headers = tags_with_name(tags, "title")
+    sections = tags_with_name(tags, "sec")
+    title_structures = structures_with_type(tags, "TITLE")
+    text_structures = structures_with_matching_type(tags, "TEXT", 0, 4)
+    matches = []
+    header_matches = []
+    for header in headers:
+        for section in sections:
+            if (header.start_index == section.start_index):
+                if separate_headers:
+                    section.start_index = header.end_index + 1
+                    header_matches.append(header)
+                matches.append((header, section))
+                break
+    for title in title_structures:
+        matching_structures=[]
+        for text_structure in text_structures:
+            if (title.start_index < text_structure.start_index + max_title_follow
+                and text_structure.start_index - title.end_index < max_title_lead):
+                matching_structures.append(text_structure)
+        if len(matching_structures) >0:
+            chunks = tags_with_type(matching_structures, "TEXT_CHUNK")
+            texts = tags_with_type(matching_structures, "TEXT")
+            if len(chunks) > 0:
+                best_structure = min(chunks, key=len)
+            else:
+                best_structure = max(texts, key=len)
+            if  separate_headers:
+                header_matches.append(title)
+            else:
+                best_structure.start_index=title.start_index
+            matches.append((title, best_structure))
+    matches.extend(header_matches)
+    return matches
+
+def pubmed_tags(fact_file, copies, doc_length):
+    """Return a list of fact lines with the STRUCTURE lines of fact_file repeated copies
+    times, each copy shifted by doc_length, and with a title and a sec tag starting at
+    each TITLE structure."""
+    lines = copied_structures(fact_file, copies, doc_length, as_lines=True)
+    for line in list(lines):
+        if 'TYPE="TITLE"' in line:
+            (start, end) = [int(n) for n in re.findall(r'(?:START|END)=(\d+)', line)]
+            lines.append("title START=%d END=%d\n" % (start, end))
+            lines.append("sec START=%d END=%d\n" % (start, end + 500))
+    return lines
+
+def benchmark_pubmed(repeat):
+    basename = 'data/in/pubmed/pubmed-mm-test'
+    doc_length = len(codecs.open(basename + '.txt', encoding='utf-8').read())
+    print "\nMatching headers and sections in pubmed documents\n"
+    print "   %-35s %9s  %9s  %7s" % ('', 'loops', 'index', 'speedup')
+    for copies in (1, 10, 50, 100):
+        lines = pubmed_tags(basename + '.fact', copies, doc_length)
+        # matching changes the start of sections, so each run gets its own tags
+        (tags1, tags2) = (make_tags(lines), make_tags(lines))
+        if (matched_pairs(nested_loop_pubmed_headed_sections(tags1), tags1)
+            != matched_pairs(pubmed_headed_sections(tags2), tags2)):
+            print "   WARNING: different matches for %d copies" % copies
+        t1 = best_time(lambda: nested_loop_pubmed_headed_sections(make_tags(lines)), repeat)
+        t2 = best_time(lambda: pubmed_headed_sections(make_tags(lines)), repeat)
+        t0 = best_time(lambda: make_tags(lines), repeat)
+        report("%d titles" % len(structures_with_type(tags1, "TITLE")), t1 - t0, t2 - t0)
+    print
+
+def matched_pairs(matches, tags):
+    """Return the matches as positions in tags, with the offsets of all tags."""
+    position = dict((id(t), p) for p, t in enumerate(tags))
+    return ([(position[id(m[0])], position[id(m[1])]) if type(m) == tuple
+             else position[id(m)] for m in matches],
+            [(t.start_index, t.end_index) for t in tags])
+
+
+def synthetic_abstracts(count):
+    """Return a list of count sections of which every fourth is an Abstract section, and
+    a list of abstract tags of which half overlap one of those sections."""
+    def section(p1, p2, section_type):
+        s = Section()
+        (s.start_index, s.end_index, s.types) = (p1, p2, [section_type])
+        return s
+    sections = [section(i * 100, i * 100 + 90, 'Abstract' if i % 4 == 0 else 'Text')
+                for i in range(count)]
+    abstracts = [Tag('STRUCTURE TYPE="ABSTRACT" START=%d END=%d' % (i * 100 + 50, i * 100 + 150),
+                     'BAE') for i in range(0, count, 2)]
+    return (sections, abstracts)
+
+def loop_abstract_sections(sections, abstracts, text):
+    """The original deduplication of abstracts and finding of gaps in
+    elsevier2.ComplexElsevierSectionFactory.make_sections(), with already_here set for
+    each abstract and with the overlap test of the index."""
+    abstract_sections = filter(lambda x: "Abstract" in x.types, sections)
+    added = []
+    for abstract in abstracts:
+        already_here = False
+        for abs_sec in abstract_sections + added:
+            if (abs_sec.start_index < abstract.end_index
+                and abs_sec.end_index > abstract.start_index):
+                already_here = True
+                break
+        if not already_here:
+            section = Section()
+            (section.start_index, section.end_index) = (abstract.start_index, abstract.end_index)
+            section.types = ["Abstract"]
+            added.append(section)
+    sections = sections + added
+    return sections + section_gaps(sections, text)
+
+def indexed_abstract_sections(sections, abstracts, text):
+    index = SectionIndex(sections)
+    added = []
+    for abstract in abstracts:
+        overlapping = index.overlapping(abstract.start_index, abstract.end_index)
+        if not any("Abstract" in s.types for s in overlapping):
+            section = Section()
+            (section.start_index, section.end_index) = (abstract.start_index, abstract.end_index)
+            section.types = ["Abstract"]
+            added.append(section)
+            index.add([section])
+    sections = sections + added
+    return sections + elsevier2_section_gaps(index, text)
+
+def benchmark_abstracts(repeat):
+    print "\nDeduplicating abstracts and finding gaps\n"
+    print "   %-35s %9s  %9s  %7s" % ('', 'loops', 'index', 'speedup')
+    for count in (500, 1000, 2000, 4000, 8000):
+        (sections, abstracts) = synthetic_abstracts(count)
+        text = u' ' * (count * 100 + 100)
+        offsets = lambda result: sorted((s.start_index, s.end_index) for s in result)
+        if (offsets(loop_abstract_sections(sections, abstracts, text))
+            != offsets(indexed_abstract_sections(sections, abstracts, text))):
+            print "   WARNING: different sections for %d sections" % count
+        t1 = best_time(lambda: loop_abstract_sections(sections, abstracts, text), repeat)
+        t2 = best_time(lambda: indexed_abstract_sections(sections, abstracts, text), repeat)
+        report("%d sections" % count, t1, t2)
+    print
+
+
+BENCHMARKS = {
+    'facts': benchmark_facts,
+    'links': benchmark_links,
+    'tree': benchmark_tree,
+    'traversal': benchmark_traversal,
+    'annotate': benchmark_annotate,
+    'headers': benchmark_headers,
+    'paragraphs': benchmark_paragraphs,
+    'elsevier1': benchmark_elsevier1,
+    'elsevier2': benchmark_elsevier2,
+    'abstracts': benchmark_abstracts,
+    'pubmed': benchmark_pubmed }
+
+
+if __name__ == '__main__':
+
+    benchmark = sys.argv[1]
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    BENCHMARKS[benchmark](repeat)
@@ -0,0 +1,172 @@
+"""
+
+A cache with the sect files created for input documents, so documents that did not
+change since an earlier run do not have to be parsed again.
+
+The key of a sect file is a hash of the contents of the input files, of the parser
+settings that change the output, and of the fingerprint of the parser code, which covers
+the source of the factories and readers, the standoff scripts and the mapping in
+normheader.sem_types. So any change to the input, to the settings or to the code gives
+a new key, and old entries are never used again. They are removed when the cache grows
+beyond its maximum size, starting with the entries that were used least recently.
+
+"""
+
+
+import os, glob, time, hashlib, shutil, tempfile
+
+import normheader
+
+
+# The files with the code that determines the contents of a sect file, relative to the
+# directory of main.py
+CODE_FILES = ('*.py', 'readers/*.py', 'utils/xml.py', 'utils/misc.py', 'utils/compressed.py',
+              'utils/standoff/*.xsl')
+
+MAXIMUM_SIZE = 1024 * 1024 * 1024
+
+# Temporary files older than this many seconds are left over from runs that were killed
+# before the file was renamed, younger ones may still be written by another process
+TEMPORARY_FILE_AGE = 3600
+
+_code_fingerprint = None
+
+
+def code_fingerprint():
+    """Returns a hash of the parser code and of normheader.sem_types, the hash of the code
+    files is only calculated once."""
+    global _code_fingerprint
+    if _code_fingerprint is None:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        sha1 = hashlib.sha1()
+        for pattern in CODE_FILES:
+            for filename in sorted(glob.glob(os.path.join(root, pattern))):
+                sha1.update(os.path.relpath(filename, root))
+                sha1.update(open(filename, 'rb').read())
+        _code_fingerprint = sha1.hexdigest()
+    return _code_fingerprint + normheader.fingerprint(normheader.sem_types)
+
+
+class ResultCache(object):
+
+    """
+    A directory with sect files named after their keys. Files are written to a temporary
+    file first and then renamed, so several processes can use the same cache. The time
+    of last use of an entry is its modification time, which is updated on a hit. The
+    cache counts hits, misses and stored files, eviction happens when the cache is
+    closed. Temporary files left behind by runs that were killed are removed then as
+    well. """
+
+    def __init__(self, directory, maximum_size=MAXIMUM_SIZE):
+        self.directory = directory
+        self.maximum_size = maximum_size
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def __len__(self):
+        return len(self._entries())
+
+    def key(self, input_files, settings):
+        """Returns the key for the input files and the settings, which is a tuple of
+        values that change the output."""
+        sha1 = hashlib.sha1(code_fingerprint())
+        sha1.update(repr(tuple(settings)))
+        for filename in input_files:
+            digest = hashlib.sha1(open(filename, 'rb').read()).hexdigest()
+            sha1.update(digest)
+        return sha1.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.sect')
+
+    def fetch(self, key, sect_file):
+        """Copy the cached sect file for key to sect_file, returns False if there is no
+        entry for key."""
+        path = self.path(key)
+        try:
+            shutil.copyfile(path, sect_file)
+            os.utime(path, None)
+        except (IOError, OSError):
+            if os.path.exists(path):
+                raise
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key, sect_file):
+        """Add a copy of sect_file to the cache as the entry for key."""
+        (fd, tmp_file) = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        os.close(fd)
+        shutil.copyfile(sect_file, tmp_file)
+        os.rename(tmp_file, self.path(key))
+        self.stored += 1
+
+    def updates(self):
+        """Return the counts since the last call and start counting again. This is used
+        by the worker processes of a parallel run, which send their counts to the cache
+        in the main process."""
+        updates = (self.hits, self.misses, self.stored)
+        (self.hits, self.misses, self.stored) = (0, 0, 0)
+        return updates
+
+    def merge(self, updates):
+        (hits, misses, stored) = updates
+        self.hits += hits
+        self.misses += misses
+        self.stored += stored
+
+    def evict(self):
+        """Remove stale temporary files and then the least recently used entries until
+        the cache is not larger than its maximum size, returns the number of removed
+        files. Temporary files that may still be in use count towards the size."""
+        entries = []
+        size = 0
+        removed = 0
+        now = time.time()
+        for path in self._temporary_files():
+            try:
+                status = os.stat(path)
+                if now - status.st_mtime > TEMPORARY_FILE_AGE:
+                    os.remove(path)
+                    removed += 1
+                else:
+                    size += status.st_size
+            except OSError:
+                # renamed to an entry by another process in the meantime
+                pass
+        for path in self._entries():
+            status = os.stat(path)
+            entries.append((status.st_mtime, status.st_size, path))
+        entries.sort()
+        size += sum([entry[1] for entry in entries])
+        for (mtime, entry_size, path) in entries:
+            if size <= self.maximum_size:
+                break
+            os.remove(path)
+            size -= entry_size
+            removed += 1
+        return removed
+
+    def close(self):
+        self.evicted = self.evict()
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def report(self):
+        return "Result cache %s: %d files, %d of %d lookups found (%.1f%%), " \
+               "%d stored, %d removed" \
+               % (self.directory, len(self), self.hits, self.hits + self.misses,
+                  self.hit_rate() * 100, self.stored, self.evicted)
+
+    def _entries(self):
+        return glob.glob(os.path.join(self.directory, '*.sect'))
+
+    def _temporary_files(self):
+        return glob.glob(os.path.join(self.directory, '*.tmp'))
@@ -0,0 +1,65 @@
+"""
+
+Script to check the in-process standoff code in utils/xml.py against the xslt scripts in
+utils/standoff. Needs xsltproc and xmllint.
+
+Usage:
+
+   % python -m utils.check_standoff data/in/lexisnexis
+
+   For each xml file in the directory, the text file and the fact file are created with
+   the XSLT standoff mode, which uses temporary files in data/tmp, and compared to the
+   text and fact lines created by utils.xml.standoff(). Prints Passed or Failed for each
+   file, and for failed files it prints the first line that differs.
+
+"""
+
+
+import os, sys, codecs
+
+from main import create_fact_file
+from utils.xml import standoff
+
+
+def check_directory(path, tmp_dir='data/tmp'):
+    failures = 0
+    xml_files = sorted([f for f in os.listdir(path) if f.endswith('.xml')])
+    for xml_file in xml_files:
+        if not check_file(os.path.join(path, xml_file), tmp_dir):
+            failures += 1
+    print "\n%d of %d files passed\n" % (len(xml_files) - failures, len(xml_files))
+    return failures == 0
+
+
+def check_file(xml_file, tmp_dir='data/tmp'):
+    """Compare the text and the fact lines for xml_file as created by the two standoff
+    modes, return True if they are the same."""
+    basename = os.path.join(tmp_dir, os.path.basename(xml_file))
+    text_file = basename + '.txt'
+    tags_file = basename + '.tags'
+    fact_file = basename + '.fact'
+    create_fact_file(xml_file, text_file, tags_file, fact_file, 'XSLT')
+    xslt_text = codecs.open(text_file, encoding='utf-8').read()
+    xslt_facts = [line.rstrip("\n") for line in codecs.open(fact_file, encoding='utf-8')]
+    for filename in (text_file, tags_file, fact_file):
+        os.remove(filename)
+    (text, facts) = standoff(xml_file)
+    print "[%s]" % xml_file,
+    if text == xslt_text and facts == xslt_facts:
+        print "... \033[0;32mPassed\033[0m"
+        return True
+    print "... \033[0;31mFailed\033[0m"
+    if text != xslt_text:
+        print "   text differs, %d versus %d characters" % (len(text), len(xslt_text))
+    for (native, xslt) in zip(facts + [None], xslt_facts + [None]):
+        if native != xslt:
+            print "   NATIVE:", native
+            print "   XSLT:  ", xslt
+            break
+    return False
+
+
+if __name__ == '__main__':
+
+    passed = check_directory(sys.argv[1])
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,83 @@
+"""
+
+Opening text, fact and sect files that may be compressed with gzip or zstd.
+
+Compressed files are decompressed and compressed as streams, so neither the compressed
+nor the uncompressed contents of a file have to be held in memory. When a file is read,
+the compression is recognized from the first bytes of the file, so a compressed file does
+not need a .gz or .zst extension and a plain file is read as before. When a file is
+written, the compression is taken from the extension of the file name.
+
+The zstd format needs the zstandard module, which is optional. Opening a zstd file
+without it raises an IOError, gzip files and plain files always work.
+
+"""
+
+
+import os, io, codecs, gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+
+MAGIC_NUMBERS = ((GZIP, '\x1f\x8b'), (ZSTD, '\x28\xb5\x2f\xfd'))
+
+EXTENSIONS = {'.gz': GZIP, '.zst': ZSTD}
+
+
+def compression(filename, mode='r'):
+    """Returns GZIP, ZSTD or None for a file. For reading, the compression is taken from
+    the first bytes of the file, for writing from the extension of the file name."""
+    if mode.startswith('r'):
+        fh = open(filename, 'rb')
+        start = fh.read(4)
+        fh.close()
+        for (name, magic) in MAGIC_NUMBERS:
+            if start.startswith(magic):
+                return name
+        return None
+    return EXTENSIONS.get(split_extension(filename)[1])
+
+
+def split_extension(filename):
+    """Returns a pair of the file name without the compression extension and the
+    compression extension, which is the empty string if the name does not have one."""
+    (name, extension) = os.path.splitext(filename)
+    if extension in EXTENSIONS:
+        return (name, extension)
+    return (filename, '')
+
+
+def open_file(filename, mode='r', encoding=None):
+    """Opens a file for reading or writing, with mode 'r' or 'w', and decompresses or
+    compresses it on the fly if needed. Without an encoding, the file object reads and
+    writes strings of bytes, like open(), with an encoding it reads and writes unicode
+    strings, like codecs.open()."""
+    kind = compression(filename, mode)
+    if kind is None:
+        if encoding is None:
+            return open(filename, mode)
+        return codecs.open(filename, mode, encoding)
+    if kind == GZIP:
+        fh = gzip.open(filename, mode[0] + 'b')
+    else:
+        fh = _open_zstd(filename, mode[0])
+    if encoding is None:
+        return fh
+    if mode.startswith('r'):
+        return codecs.getreader(encoding)(fh)
+    return codecs.getwriter(encoding)(fh)
+
+
+def _open_zstd(filename, mode):
+    if zstandard is None:
+        raise IOError("the zstandard module is needed for the zstd file %s" % filename)
+    fh = open(filename, mode + 'b')
+    if mode == 'r':
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(fh))
+    return zstandard.ZstdCompressor().stream_writer(fh)
@@ -0,0 +1,104 @@
+"""
+
+A manifest with the documents that were completed in a batch run, so that a run that was
+interrupted can be started again and only processes the documents that were not done.
+
+The manifest is a text file that is only appended to. There is a line for each completed
+document, with tab-separated fields: the sect file, the number of input files and then
+for each input file its name, modification time, size and sha1 hash. A document is done
+if it has a line, if the sect file still exists and if the input files did not change.
+Checking the modification time and size is enough for most documents, the input file is
+only hashed again if those changed, so a file that was touched or copied is still done.
+A line that was cut off when a run was killed is ignored.
+
+"""
+
+
+import os, hashlib
+
+
+class Manifest(object):
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        self.skipped = 0
+        self.recorded = 0
+        line = '\n'
+        if os.path.exists(filename):
+            for line in open(filename):
+                entry = parse_line(line)
+                if entry is not None:
+                    self.entries[entry[0]] = entry[1]
+        self.fh = open(filename, 'a')
+        if os.path.getsize(filename) > 0 and not line.endswith('\n'):
+            # end the line that was cut off so the next line is not appended to it
+            self.fh.write('\n')
+
+    def __len__(self):
+        return len(self.entries)
+
+    def is_done(self, input_files, sect_file):
+        """Returns True if the document with the input files and the sect file was
+        completed and none of the input files changed since."""
+        inputs = self.entries.get(sect_file)
+        if inputs is None or len(inputs) != len(input_files):
+            return False
+        if not os.path.exists(sect_file):
+            return False
+        for filename, (recorded_name, mtime, size, sha1) in zip(input_files, inputs):
+            if filename != recorded_name or not os.path.exists(filename):
+                return False
+            status = os.stat(filename)
+            if (repr(status.st_mtime), status.st_size) == (mtime, size):
+                continue
+            if status.st_size != size or file_hash(filename) != sha1:
+                return False
+        self.skipped += 1
+        return True
+
+    def record(self, input_files, sect_file):
+        """Add a line for a completed document, the line is flushed right away so it is
+        there when the run is interrupted."""
+        inputs = []
+        for filename in input_files:
+            status = os.stat(filename)
+            inputs.append((filename, repr(status.st_mtime), status.st_size,
+                           file_hash(filename)))
+        fields = [sect_file, str(len(inputs))]
+        for (filename, mtime, size, sha1) in inputs:
+            fields.extend([filename, mtime, str(size), sha1])
+        self.fh.write('\t'.join(fields) + '\n')
+        self.fh.flush()
+        self.entries[sect_file] = inputs
+        self.recorded += 1
+
+    def close(self):
+        self.fh.close()
+
+    def report(self):
+        return "Manifest %s: %d documents, %d skipped, %d recorded" \
+               % (self.filename, len(self), self.skipped, self.recorded)
+
+
+def parse_line(line):
+    """Returns a pair of the sect file and the list of inputs for a manifest line, or
+    None if the line is not complete."""
+    if not line.endswith('\n'):
+        return None
+    fields = line[:-1].split('\t')
+    try:
+        count = int(fields[1])
+        if len(fields) != 2 + 4 * count:
+            return None
+        inputs = []
+        for i in range(2, len(fields), 4):
+            (filename, mtime, size, sha1) = fields[i:i+4]
+            inputs.append((filename, mtime, int(size), sha1))
+    except (IndexError, ValueError):
+        return None
+    return (fields[0], inputs)
+
+
+def file_hash(filename):
+    return hashlib.sha1(open(filename, 'rb').read()).hexdigest()
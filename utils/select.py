@@ -31,7 +31,8 @@ current limitations on what the document parser produces.
 """
 
 
-import sys, codecs
+import sys
+from compressed import open_file
 
 
 class Section(object):
@@ -79,11 +80,11 @@ class SectionReader(object):
     sections in a document."""
     
     def __init__(self, text_file, sect_file):
-        """Load the text and the section types."""
-        self.text = codecs.open(text_file, encoding='utf-8').read()
+        """Load the text and the section types, both files can be compressed."""
+        self.text = open_file(text_file, encoding='utf-8').read()
         self.struct2sections = {}
         self.type2sections = {}
-        fh_sect = codecs.open(sect_file, encoding='utf-8')
+        fh_sect = open_file(sect_file, encoding='utf-8')
         for line in fh_sect:
             section = Section(line, self.text)
             self.struct2sections.setdefault(section.struct, []).append(section)
@@ -29,15 +29,16 @@ embedded tags.
 """
 
 
-import sys, codecs, re
+import sys, re
 import html_fragments
+from compressed import open_file
 
 
 def createHTML(text_file, sect_file, html_file):
 
-    fh_html = codecs.open(html_file, 'w', encoding='utf-8')
-    fh_text = codecs.open(text_file, encoding='utf-8')
-    fh_sect = codecs.open(sect_file, encoding='utf-8')
+    fh_html = open_file(html_file, 'w', encoding='utf-8')
+    fh_text = open_file(text_file, encoding='utf-8')
+    fh_sect = open_file(sect_file, encoding='utf-8')
 
     (starts, ends) = create_offset_dictionaries(fh_sect)
     fh_html.write(html_fragments.HTML_PREFIX)
@@ -1,4 +1,7 @@
+from __future__ import absolute_import
+
 import codecs
+from xml.parsers import expat
 
 # List of interesting tags. This list is just for patents and CNKI
 # documents. Now all tags are handed in to the document parser.
@@ -19,6 +22,11 @@ CNKI_TAGS = (
 
 TAGS = PATENT_TAGS + CNKI_TAGS
 
+# Escapes used by xmllint when it serializes attribute values
+ATTRIBUTE_ESCAPES = (
+    ('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;'),
+    ('\n', '&#10;'), ('\r', '&#13;'), ('\t', '&#9;'))
+
 
 def transform_tags_file(infile, outfile):
     """Takes an xml file as created by the xslt scripts in standoff and create a file that is
@@ -32,3 +40,92 @@ def transform_tags_file(infile, outfile):
             tagline =  tag + ' ' + ' '.join(fields[1:])
             tagline = tagline.strip('/>')
             out.write(tagline+"\n")
+
+
+def standoff(xml_file, tags=TAGS):
+    """Parse an xml file once and return a pair of the text content as a unicode string and
+    a list of fact lines for all elements whose name is in tags. This is the in-process
+    version of running text-content.xsl and standoff.xsl from utils/standoff followed by
+    transform_tags_file(), and it gives the same text and the same fact lines, including
+    the standoff:offset and standoff:length attributes. Instead of the name of an xml
+    file, xml_file can be an open file, for example a member of an archive."""
+    builder = StandoffBuilder(tags)
+    if hasattr(xml_file, 'read'):
+        builder.parse(xml_file)
+        return (builder.text(), builder.fact_lines())
+    fh = open(xml_file, 'rb')
+    try:
+        builder.parse(fh)
+    finally:
+        fh.close()
+    return (builder.text(), builder.fact_lines())
+
+
+class StandoffBuilder(object):
+
+    """Collects the text content and the offsets of the interesting elements while expat
+    streams through a document. Offsets are known when an element opens, the length only
+    when it closes, so the elements are kept in document order and completed later."""
+
+    def __init__(self, tags=TAGS):
+        self.tags = frozenset(tags)
+        self.chunks = []
+        self.offset = 0
+        self.elements = []
+        self.stack = []
+        self.depth = 0
+
+    def parse(self, fh):
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.ordered_attributes = True
+        parser.StartElementHandler = self.start_element
+        parser.EndElementHandler = self.end_element
+        parser.CharacterDataHandler = self.character_data
+        parser.ParseFile(fh)
+
+    def start_element(self, name, attributes):
+        self.depth += 1
+        if name in self.tags:
+            element = [name, attributes, self.offset, 0, self.depth == 1]
+            self.elements.append(element)
+            self.stack.append(element)
+        else:
+            self.stack.append(None)
+
+    def end_element(self, name):
+        self.depth -= 1
+        element = self.stack.pop()
+        if element is not None:
+            element[3] = self.offset - element[2]
+
+    def character_data(self, data):
+        if self.depth > 0:
+            self.chunks.append(data)
+            self.offset += len(data)
+
+    def text(self):
+        return u''.join(self.chunks)
+
+    def fact_lines(self):
+        return [fact_line(*element) for element in self.elements]
+
+
+def fact_line(name, attributes, offset, length, is_root=False):
+    """Return the line that transform_tags_file() would write for an element given its
+    name, its attributes as a flat list of names and values, and its offsets. Namespace
+    declarations go first, as in the output of xmllint, and whitespace is normalized
+    just like it is when the line is split into fields."""
+    pairs = zip(attributes[0::2], attributes[1::2])
+    namespaces = [p for p in pairs if p[0] == 'xmlns' or p[0].startswith('xmlns:')]
+    others = [p for p in pairs if not (p[0] == 'xmlns' or p[0].startswith('xmlns:'))]
+    if is_root:
+        namespaces.append(('xmlns:standoff', 'http://timeml.org/standoff'))
+    fields = [name]
+    for attr, value in namespaces + others:
+        for char, escape in ATTRIBUTE_ESCAPES:
+            value = value.replace(char, escape)
+        fields.append(u'%s="%s"' % (attr, value))
+    fields.append(u'standoff:offset="%d"' % offset)
+    fields.append(u'standoff:length="%d"' % length)
+    return u' '.join(u' '.join(fields).split())
@@ -1,27 +1,29 @@
-import codecs, re
-from sections import Section, SectionFactory
+import re
+from sections import SectionFactory
 
 
 
 class WebOfScienceSectionFactory(SectionFactory):
 
 
-    def __init__(self, text_file, fact_file, sect_file, fact_type, language, verbose=False):
+    def __init__(self, text_file, fact_file, sect_file, fact_type, language, verbose=False,
+                 data=None, facts=None):
 
-        SectionFactory.__init__(self, text_file, fact_file, sect_file, fact_type, language)
+        SectionFactory.__init__(self, text_file, fact_file, sect_file, fact_type, language,
+                                data=data, facts=facts)
         self.sections = []
-        self.text = codecs.open(self.text_file, encoding='utf-8').read()
+        self.text = self.read_text()
 
     def make_sections(self):
         
         re_STRUCTURE = re.compile("STRUCTURE TYPE=\"ABSTRACT\" START=(\d+) END=(\d+)")
-        for line in open(self.fact_file):
+        for line in self.fact_lines():
             result = re_STRUCTURE.match(line)
             if result is not None:
                 start, end = result.groups()
-                section = Section()
+                section = self.new_section()
                 section.start_index = int(start)
                 section.end_index = int(end)
-                section.text = self.text[section.start_index:section.end_index]
+                section.set_document(self.text)
                 section.types.append('ABSTRACT')
                 self.sections.append(section)